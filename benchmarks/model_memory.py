@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Memory comparison of the former dict based content model and the slotted model of libs.model.
+Builds a synthetic corpus shaped like a merged and linked page namespace.
+
+python3 benchmarks/model_memory.py [contents] [langs]
+"""
+import gc
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from libs.model import Author, Content, LangDict  # noqa: E402
+from libs.setofmutable import SetOfMutable  # noqa: E402
+
+AUTHORS = 50
+TAGS = 200
+LANGS = ("en", "de", "fr", "es", "it")
+
+
+def headers(i: int, lang: str) -> dict:
+    return {
+        "title": f"Title of content {i} ({lang})",
+        "date": "2020-02-16",
+        "description": f"Description {i}",
+        "tags": {f"tag{i % TAGS}", f"tag{(i * 7) % TAGS}"},
+        "publish": True,
+        "linkto": {f"content/{(i + 1)}"},
+        "content": "",
+    }
+
+
+def build_dicts(count: int, langs: tuple) -> dict:
+    "Former model: plain dicts, SetOfMutable links and stored otherlangs dicts"
+    authors = {f"author{a}": {"nickname": f"author{a}", "contents": dict(), "gitsources": set()} for a in range(AUTHORS)}
+    contents = dict()
+
+    for i in range(count):
+        contentid = f"content/{i}"
+        author = authors[f"author{i % AUTHORS}"]
+        contentl = contents[contentid] = dict()
+        for lang in langs:
+            c = headers(i, lang)
+            c.update(id=contentid, lang=lang, mdsource=f"content/{i}/{lang}.md", gitsource="https://example.com/repo.git",
+                     author=author, links=SetOfMutable(), files=set())
+            contentl[lang] = c
+        author["contents"][contentid] = contentl
+
+    previous = None
+    for contentid, contentl in contents.items():
+        for lang, c in contentl.items():
+            c["langs"] = contentl
+            c["otherlangs"] = {ol: oc for ol, oc in contentl.items() if oc is not c}
+            if previous is not None and lang in previous:
+                c["links"].add(previous[lang])
+                previous[lang]["links"].add(c)
+        previous = contentl
+
+    return {"authors": authors, "contents": contents}
+
+
+def build_slotted(count: int, langs: tuple) -> dict:
+    "Slotted model with interned ids and weak references"
+    authors = {f"author{a}": Author({"nickname": f"author{a}"}) for a in range(AUTHORS)}
+    contents = dict()
+
+    for i in range(count):
+        contentid = f"content/{i}"
+        author = authors[f"author{i % AUTHORS}"]
+        contentl = contents[contentid] = LangDict()
+        for lang in langs:
+            c = Content(contentid, lang, headers(i, lang))
+            c.mdsource = f"content/{i}/{lang}.md"
+            c.gitsource = "https://example.com/repo.git"
+            c.files = set()
+            c.author = author
+            contentl[lang] = c
+        author.contents[contentid] = contentl
+
+    previous = None
+    for contentid, contentl in contents.items():
+        for lang, c in contentl.items():
+            c.langs = contentl
+            if previous is not None and lang in previous:
+                c.add_link(previous[lang])
+                previous[lang].add_link(c)
+        previous = contentl
+
+    return {"authors": authors, "contents": contents}
+
+
+def measure(name: str, builder, count: int, langs: tuple):
+    gc.collect()
+    tracemalloc.start()
+    t = time.perf_counter()
+    namespace = builder(count, langs)
+    buildtime = time.perf_counter() - t
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    t = time.perf_counter()
+    gc.collect()
+    gctime = time.perf_counter() - t
+
+    # Release: the dict model needs a full cyclic collection, the slotted model is freed by refcounting
+    del namespace
+    t = time.perf_counter()
+    unreachable = gc.collect()
+    releasetime = time.perf_counter() - t
+
+    print(f"{name:10} {current / 2**20:10.1f} {peak / 2**20:10.1f} {buildtime:8.2f} {gctime * 1000:9.1f}"
+          f" {releasetime * 1000:10.1f} {unreachable:12}")
+    return current
+
+
+def main(args: list):
+    count = int(args[0]) if len(args) > 0 else 20000
+    langs = LANGS[:int(args[1])] if len(args) > 1 else LANGS[:2]
+
+    print(f"Synthetic corpus: {count} contents x {len(langs)} languages, {AUTHORS} authors\n")
+    print(f"{'model':10} {'MiB':>10} {'peak MiB':>10} {'build s':>8} {'gc ms':>9} {'release ms':>10} {'unreachable':>12}")
+    dicts = measure("dicts", build_dicts, count, langs)
+    slotted = measure("slotted", build_slotted, count, langs)
+    print(f"\nSlotted model uses {slotted / dicts:.0%} of the dict model's memory.")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
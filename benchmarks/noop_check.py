@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Cost of the "anything changed?" check of a run without changes.
+Creates minimal git folders of many repos, stores their HEADs and checks them again.
+Fails if GitPython gets imported or if the check is slower than the limit.
+
+python3 benchmarks/noop_check.py [repos] [limit_ms]
+"""
+import io
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from libs.filecopying import PathC  # noqa: E402
+from libs.pagecontent import PageContent  # noqa: E402
+from libs.pagestate import PageState  # noqa: E402
+from libs.repo import RepoDir  # noqa: E402
+from libs.streamlogging import Logger  # noqa: E402
+
+
+def fake_repo(path: Path, number: int, packed: bool):
+    "Just the files read for a HEAD check. Half of the repos use packed refs."
+    gitdir = path / ".git"
+    (gitdir / "refs" / "heads").mkdir(parents=True)
+    (gitdir / "HEAD").write_text("ref: refs/heads/master\n")
+    sha = f"{number:040x}"
+    if packed:
+        (gitdir / "packed-refs").write_text(f"# pack-refs with: peeled fully-peeled sorted\n"
+                                            f"{sha} refs/heads/master\n")
+    else:
+        (gitdir / "refs" / "heads" / "master").write_text(sha + "\n")
+    (gitdir / "config").write_text(f'[remote "origin"]\n\turl = https://example.org/repo{number}.git\n')
+
+
+def open_repos(root: Path, count: int) -> dict:
+    return {"AUTHORS": {f"repo{i}": RepoDir(PathC(root / f"repo{i}"), f"repo{i}") for i in range(count)}}
+
+
+def main(args: list) -> int:
+    count = int(args[0]) if len(args) > 0 else 50
+    limit_ms = float(args[1]) if len(args) > 1 else 20
+
+    log = Logger(io.StringIO(), io.StringIO(), io.StringIO())
+    generator = PageContent(None, None, log)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        for i in range(count):
+            fake_repo(root / f"repo{i}", i, i % 2 == 1)
+
+        statefile = root / "state.json"
+        state = PageState(statefile)
+        repos = open_repos(root, count)
+        assert generator.need_regenerate(repos, state), "Unknown repos must count as changed"
+        for kind, repodict in repos.items():
+            for repoid, repo in repodict.items():
+                state.set(state.key(kind, repoid), repo.head)
+        state.save()
+
+        # The measured no-op run: read the state and all HEADs
+        start = time.perf_counter()
+        changed = generator.need_regenerate(open_repos(root, count), PageState(statefile))
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+    print(f"No-op check of {count} repos: {elapsed_ms:.2f} ms (limit {limit_ms:.0f} ms)")
+
+    failed = False
+    if changed:
+        print("Unchanged repos reported as changed.")
+        failed = True
+    if "git" in sys.modules:
+        print("GitPython was imported.")
+        failed = True
+    if elapsed_ms > limit_ms:
+        print("Check too slow.")
+        failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
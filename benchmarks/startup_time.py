@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Startup time of the updater without any work to do.
+Runs the cron no-op (update.py --cron --noclone) in a fresh interpreter with python -X importtime
+against a fixture of minimal author and template repos whose HEADs are already processed.
+Fails if the run does not end as no-op, if a heavy module gets imported or if the run takes longer than the limit.
+
+python3 benchmarks/startup_time.py [limit_ms]
+"""
+import re
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from config import Config  # noqa: E402
+from libs.pagecontent import STATE_FILE  # noqa: E402
+from libs.pagestate import PageState  # noqa: E402
+from libs.repo import RepoDir  # noqa: E402
+from noop_check import fake_repo  # noqa: E402
+
+# Must only be imported by the stages using them
+HEAVY_MODULES = ("git", "jinja2", "markdown", "yaml", "numpy", "scipy", "PIL", "brotli")
+
+DEFAULT_LIMIT_MS = 150
+
+# Measured in the child: Config.ROOT points to the fixture given as argument
+NOOP_RUN = """
+import sys, time
+start = time.perf_counter()
+from pathlib import Path
+import update
+
+class FixtureConfig(update.Config):
+    ROOT = Path(sys.argv[1])
+
+config = FixtureConfig()
+update.Updater(config).main(["--page", sys.argv[2], "--cron", "--noclone"])
+print(f"elapsed_us={int((time.perf_counter() - start) * 1000000)}")
+"""
+
+NOOP_MESSAGE = "No regeneration needed"
+
+runtime_line = re.compile(r"^elapsed_us=(\d+)$", re.MULTILINE)
+
+importtime_line = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def create_fixture(root: Path) -> Config:
+    """
+    Minimal git folders of all configured repos below root and a state of their HEADs,
+    so the cron run finds nothing to do.
+    """
+    class FixtureConfig(Config):
+        ROOT = root
+
+    config = FixtureConfig()
+    for number, pageconfig in enumerate(config.PAGES.values()):
+        state = PageState(pageconfig.ROOT / STATE_FILE)
+        for kind, sources in pageconfig.GIT_SOURCES.items():
+            for i, repoid in enumerate(sources):
+                folder = pageconfig.CLONE_DESTINATIONS[kind] / repoid
+                fake_repo(folder, number * 1000 + i, i % 2 == 1)
+                state.set(state.key(kind, repoid), RepoDir(folder, repoid).head)
+        state.save()
+    return config
+
+
+def measure(root: Path, pageconfig) -> tuple:
+    """
+    (run time in microseconds, {module: (cumulative import time in microseconds, nesting level)})
+    of one no-op run
+    """
+    res = subprocess.run((sys.executable, "-X", "importtime", "-c", NOOP_RUN, str(root), pageconfig.PAGEID),
+                         cwd=str(ROOT), stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    if res.returncode:
+        sys.stderr.write(res.stderr)
+        raise SystemExit(f"No-op run failed with exit code {res.returncode}")
+
+    logfile = pageconfig.LOGFILE
+    if NOOP_MESSAGE not in logfile.read_text(encoding="UTF-8"):
+        sys.stderr.write(logfile.read_text(encoding="UTF-8"))
+        raise SystemExit("Run did not end as no-op.")
+
+    modules = dict()
+    for line in res.stderr.splitlines():
+        m = importtime_line.match(line)
+        if m:
+            modules[m.group(4)] = int(m.group(2)), len(m.group(3))
+    return int(runtime_line.search(res.stdout).group(1)), modules
+
+
+def main(args: list) -> int:
+    limit_ms = float(args[0]) if args else DEFAULT_LIMIT_MS
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        pageconfig = next(iter(create_fixture(root).PAGES.values()))
+        # Best of a few runs. The first one may suffer from a cold disk cache.
+        runs = [measure(root, pageconfig) for _ in range(5)]
+
+    total_us = min(elapsed for elapsed, _ in runs)
+    # Everything imported by any of the runs
+    modules = dict()
+    for _, runmodules in runs:
+        modules.update(runmodules)
+
+    heavy = sorted(name for name in modules if name.split(".")[0] in HEAVY_MODULES)
+
+    slowest = sorted(((cumulative, name) for name, (cumulative, level) in modules.items() if level == 1),
+                     reverse=True)[:10]
+    print("Slowest top level imports:")
+    for cumulative, name in slowest:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+    print(f"No-op run: {total_us / 1000:.1f} ms (limit {limit_ms:.0f} ms)")
+
+    failed = False
+    if heavy:
+        print("Heavy modules imported by the no-op run: " + ", ".join(heavy))
+        failed = True
+    if total_us / 1000 > limit_ms:
+        print("Startup too slow.")
+        failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
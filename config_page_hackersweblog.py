@@ -67,9 +67,27 @@ class HackersweblogConfig(PageConfig):
         "content:linking": True,  # meta headers linkto, linkwith
         "content:tags": True,  # tags and tag index pages
         "content:authors": True,  # Create author pages
+        "content:related": 0,  # content.related: number of contents sharing most tags. 0 disables. Needs numpy.
         "files:copy:other": True,  # copy images, downloads
         "files:copy:md": False,  # copy md source file
+        "files:hardlink": True,  # INDEX_ONLY: copy each file once, hardlink it into the other language folders
+        "files:images": None,  # e.g. {"widths": (480, 960, 1920), "webp": True, "quality": 80}. Needs Pillow.
+        "files:fingerprint": False,  # Template files also as name.<hash>.ext. Use {{ asset("css/style.css") }}.
+        "files:precompress": False,  # .gz and .br siblings of html, css, js, svg files (nginx gzip_static)
         "generate:fileindex": Path("files.txt"),
+        "generate:changes": None,  # Changed URLs for cache purges. Path("changes.json"), command (stdin) or callable
+        "render:streaming": False,  # Load bodies on render and stream pages into files. Bounded memory, no minify.
+        "html:minify": False,  # Minify rendered pages (pre, textarea, script and style stay untouched)
+        "output:writers": 8,  # Background threads writing pages and copying files. 0 writes in the main thread.
+        "output:deterministic": False,  # Times from git commits instead of now, sorted listings, unchanged files kept.
+        "output:timezone": None,  # tzinfo of commit times, e.g. datetime.timezone(datetime.timedelta(hours=1)). UTC
+        "read:workers": 0,  # Processes parsing md files of large sites (200+ files). 0 parses in the main process.
+        "generate:searchindex": None,  # Client side search index folder below WEBROOT, e.g. Path("search")
+        "generate:sitemap": False,  # sitemap.xml, sharded with sitemap index above 50000 URLs
+        "generate:feeds": 0,  # Atom feeds per language and tag with this number of latest entries. 0 disables.
+        "check:links": False,  # Report internal links not resolving to written files or static folders
+        "cache:snapshot": False,  # Reuse the namespace while author repos and settings are unchanged
+        "index:sqlite": False,  # ROOT/contents.sqlite. Templates query e.g. index.latest(5, tag="x", lang=lang).
         "lang:preferisolate": True,
     }
 
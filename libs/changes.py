@@ -0,0 +1,135 @@
+"""
+Manifest of public URLs added, modified or deleted by a build, e.g. for purging CDN or proxy caches.
+
+Files are compared by content hash with the previous build. Hashes are remembered together with
+size and mtime, so only files written again are read.
+"""
+import datetime
+import hashlib
+import json
+import shlex
+import subprocess
+from pathlib import Path
+from urllib.parse import quote
+
+from libs.filewriting import write_atomic
+from libs.streamlogging import Logger
+
+STATE_VERSION = 1
+
+# Compressed siblings are served under the URL of their source file
+SIBLING_SUFFIXES = (".gz", ".br")
+
+
+def _hash(file: Path) -> str:
+    h = hashlib.sha1()
+    with open(str(file), "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class ChangeManifest:
+    def __init__(self, baseaddress: str, statefile: Path, log: Logger):
+        self.baseaddress = baseaddress.rstrip("/")
+        self.statefile = statefile
+        self.log = log
+
+    def _load_state(self) -> dict:
+        if self.statefile.is_file():
+            try:
+                state = json.loads(self.statefile.read_text(encoding="UTF-8"))
+                if state.get("version") == STATE_VERSION:
+                    return state["files"]
+            except (ValueError, KeyError):
+                pass
+            self.log.warn(f"Change state unreadable. Reporting all files as added: {self.statefile}")
+        return dict()
+
+    def urls(self, fileid: str, pageurls: dict) -> list:
+        "Absolute URLs of file fileid. Pages also by their content URL."
+        urls = [self.baseaddress + quote("/" + fileid)]
+        pageurl = pageurls.get(fileid)
+        if pageurl is not None and pageurl != urls[0][len(self.baseaddress):]:
+            urls.insert(0, self.baseaddress + pageurl)
+        return urls
+
+    def collect(self, touched_files: dict, pageurls: dict, partial: bool = False) -> dict:
+        """
+        Compare touched_files with the previous build and remember them for the next one.
+        :param touched_files: {file path relative to webroot: file} of the complete build
+        :param pageurls: {file path relative to webroot: url} of content pages
+        :param partial: touched_files are only a part of the site. Other files are kept, nothing is deleted.
+        :return: {"added", "modified", "deleted": sorted absolute URLs}
+        """
+        oldstate = self._load_state()
+        state = dict(oldstate) if partial else dict()
+        added, modified = set(), set()
+
+        for fileid, file in touched_files.items():  # type: str, PathC
+            if fileid.endswith(SIBLING_SUFFIXES) and fileid[:-3] in touched_files:
+                continue
+            if not file.is_file():
+                continue
+
+            st = file.stat()
+            stamp = [st.st_size, st.st_mtime_ns]
+            urls = self.urls(fileid, pageurls)
+            known = oldstate.pop(fileid, None)
+            if known is not None and known[0] == stamp:
+                filehash = known[1]
+            else:
+                filehash = _hash(file)
+
+            state[fileid] = [stamp, filehash, urls]
+            if known is None:
+                added.update(urls)
+            elif known[1] != filehash:
+                modified.update(urls)
+
+        deleted = set()
+        if not partial:
+            for _, _, urls in oldstate.values():
+                deleted.update(urls)
+        # Same URL may now be served by another file
+        deleted.difference_update(added, modified)
+
+        write_atomic(self.statefile, json.dumps({"version": STATE_VERSION, "files": state},
+                                                sort_keys=True).encode("UTF-8"))
+        self.log.summary("Changed URLs", added=len(added), modified=len(modified), deleted=len(deleted))
+
+        return {
+            "baseaddress": self.baseaddress,
+            "generated": datetime.datetime.now().isoformat(timespec="seconds"),
+            "added": sorted(added),
+            "modified": sorted(modified),
+            "deleted": sorted(deleted),
+        }
+
+
+def run_hook(hook, manifest: dict, root: Path, log: Logger):
+    """
+    Hand manifest to the consumer configured as feature "generate:changes":
+        Path: JSON file, relative to root if not absolute
+        str: command line getting the JSON on stdin
+        callable: hook(manifest)
+    """
+    if isinstance(hook, Path):
+        if not hook.is_absolute():
+            hook = root / hook
+        write_atomic(hook, json.dumps(manifest, indent=1).encode("UTF-8"))
+
+    elif isinstance(hook, str):
+        try:
+            res = subprocess.run(shlex.split(hook), input=json.dumps(manifest), universal_newlines=True)
+        except OSError as e:
+            log.err(f"Change hook '{hook}' could not be started: {e}")
+            return
+        if res.returncode:
+            log.err(f"Change hook '{hook}' failed with exit code {res.returncode}.")
+
+    elif callable(hook):
+        hook(manifest)
+
+    else:
+        log.warn(f"Unknown change hook: {hook!r}")
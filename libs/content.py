@@ -1,21 +1,33 @@
 from libs.filecopying import PathC
-from libs.repo import RepoDir
 from libs.streamlogging import Logger
-from jinja2 import Environment, select_autoescape
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from typing import TextIO, TYPE_CHECKING
+from pathlib import PurePosixPath
 import markdown as mdmod
+import hashlib
+import json
 import re
 
+if TYPE_CHECKING:
+    from libs.repo import RepoDir
+
 is_html = re.compile(r"^.+\.html?$")
 
+# Manifest of fingerprinted template files in each installed template folder
+ASSET_MANIFEST = "assets.json"
+
 
 def markdown(text: str) -> str:
     return "yeah!"
 
 
 class Template:
-    def __init__(self, myid: str, repo: RepoDir, basemodels: tuple):
+    def __init__(self, myid: str, repo: "RepoDir", basemodels: tuple, fingerprint: bool = False):
         self.templateid = myid
+        self.path = repo.path
         self.files = repo.files
+        self.fingerprint = fingerprint
+        self.manifest = self.load_manifest() if fingerprint else dict()  # template file path -> hashed file path
         self.envs = self._load_envs(basemodels)
         self.templatevars = self._load_templatevars()
 
@@ -26,15 +38,14 @@ class Template:
             if model not in self.files:
                 raise FileNotFoundError(f"Base model '{model}' not found in template '{self.templateid}'")
 
-            htmlfile = self.files[model]
-
             e = Environment(
                 # undefined=1,
+                loader=FileSystemLoader(str(self.path)),
                 autoescape=select_autoescape(['html'])
             )
 
-            e.tem
             e.filters["markdown"] = markdown
+            e.globals["asset"] = self.asset
 
             envs[model] = e
 
@@ -46,10 +57,12 @@ class Template:
             "head_extras": f"""<base href='/{self.templateid}/'>""",
         }
 
-    def install_template_files(self, destdir: PathC) -> list:
-        "Copy all template related files into specified directory."
-        copied_files = list()
+    def asset(self, path: str) -> str:
+        "Absolute URL of a template file. Points to the content hashed file name if fingerprinting is enabled."
+        return f"/{self.templateid}/{self.manifest.get(path, path)}"
 
+    def _static_files(self):
+        "(template file path, file) of all files installed into the webroot"
         for fpath, file in self.files.items():  # type: str, PathC
             if not file.is_file():
                 # We don't copy directories. They get created in destdir automatically.
@@ -59,6 +72,30 @@ class Template:
                 # Skip all html files. Should only affect models.
                 continue
 
+            yield fpath, file
+
+    def load_manifest(self) -> dict:
+        """
+        Content hashed name of each static template file.
+        Known before and without installing, so every build links the same names.
+        """
+        manifest = dict()
+        for fpath, file in self._static_files():
+            digest = hashlib.sha1(file.read_bytes()).hexdigest()[:12]
+            source = PurePosixPath(fpath)
+            manifest[fpath] = str(source.with_name(f"{source.stem}.{digest}{source.suffix}"))
+        return manifest
+
+    def install_template_files(self, destdir: PathC) -> list:
+        """
+        Copy all template related files into specified directory.
+        Files are only rewritten if their content changed.
+        With fingerprinting each file is additionally installed as name.<hash>.ext for far-future caching.
+        Stable names stay, so relative references between template files keep working.
+        """
+        copied_files = list()
+
+        for fpath, file in self._static_files():
             # New full file path
             destfile = destdir / fpath
 
@@ -67,29 +104,54 @@ class Template:
             if not parent.exists():
                 parent.mkdir(exist_ok=True, parents=True)
 
-            newfile = file.copy(destfile)
-            copied_files.append(newfile)
+            data = file.read_bytes()
+            if not destfile.is_file() or destfile.read_bytes() != data:
+                file.copy(destfile)
+            copied_files.append(destfile)
+
+            if fpath in self.manifest:
+                hashedfile = destdir / self.manifest[fpath]
+                if not hashedfile.is_file():
+                    # Same name means same content
+                    file.copy(hashedfile)
+                copied_files.append(hashedfile)
+
+        if self.fingerprint:
+            manifestfile = destdir / ASSET_MANIFEST
+            manifestfile.write_text(json.dumps(self.manifest, sort_keys=True, indent=1), encoding="UTF-8")
+            copied_files.append(manifestfile)
 
         return copied_files
 
-    def generate(self, namespace: dict, content: dict, htmlmodel: str = "content.html") -> str:
+    def _get_template(self, htmlmodel: str):
         if htmlmodel not in self.envs:
             raise FileNotFoundError(f"htmlmodel '{htmlmodel}' not found in template {self.templateid}")
 
         e: Environment = self.envs[htmlmodel]
-        t = e.get_template('mytemplate.html')
+        return e.get_template(htmlmodel)
+
+    def generate(self, namespace: dict, content: dict, htmlmodel: str = "content.html") -> str:
+        t = self._get_template(htmlmodel)
         return t.render(**namespace, content=content, template=self.templatevars)
 
+    def stream(self, namespace: dict, content: dict, stream: TextIO, htmlmodel: str = "content.html"):
+        "Render directly into stream without building the whole page in memory."
+        t = self._get_template(htmlmodel)
+        for chunk in t.generate(**namespace, content=content, template=self.templatevars):
+            stream.write(chunk)
+
 
 class ContentGenerator:
-    def __init__(self, templates: dict, models: tuple, log: Logger, defaulttemplate: str = None):
+    def __init__(self, templates: dict, models: tuple, log: Logger, defaulttemplate: str = None,
+                 fingerprint: bool = False):
         self.log = log
 
         if not templates:
             raise FileNotFoundError("No templates provided.")
 
         # Load each template
-        self.templates = {templateid: Template(templateid, repo, models) for templateid, repo in templates.items()}
+        self.templates = {templateid: Template(templateid, repo, models, fingerprint)
+                          for templateid, repo in templates.items()}
 
         # Check and get default tamplate
         if defaulttemplate is None:
@@ -114,13 +176,17 @@ class ContentGenerator:
                 else:
                     touched_files[relpath] = file
 
-    def generate_content(self, namespace: dict, htmlmodel: str, content: dict) -> str:
+    def get_template(self, content: dict) -> Template:
         template_str = content.get("template", self.defaulttemplate_str)
 
         if template_str not in self.templates:
             # Unknown template specified. Using default
-            template = self.defaulttemplate
-        else:
-            template = self.templates[template_str]
+            return self.defaulttemplate
+
+        return self.templates[template_str]
+
+    def generate_content(self, namespace: dict, htmlmodel: str, content: dict) -> str:
+        return self.get_template(content).generate(namespace, content, htmlmodel)
 
-        return template.generate(namespace, content, htmlmodel)
+    def stream_content(self, namespace: dict, htmlmodel: str, content: dict, stream: TextIO):
+        self.get_template(content).stream(namespace, content, stream, htmlmodel)
@@ -0,0 +1,217 @@
+"""
+SQLite index of the merged namespace.
+
+The database persists between runs below pageconfig.ROOT. Each run only rewrites rows of contents
+whose headers, tags, links or location changed and deletes rows of vanished contents.
+Headers and tags are only compared for contents of author repos at a new HEAD or after settings changed.
+Contents of unchanged repos only get their locations and links compared, which may depend on other repos.
+The namespace itself is still built or loaded as a whole before.
+Templates query it through namespace["index"], e.g. {% for c in index.latest(5, tag="linux", lang=lang) %}.
+Contents with a publish date not reached yet are not part of the namespace and never stored.
+Hidden contents (publish: hidden) are stored, but left out of listings.
+"""
+import hashlib
+import json
+import sqlite3
+from pathlib import Path
+
+from libs.sitemap import isodate
+from libs.streamlogging import Logger
+
+# Increase on any change of the schema. Old databases are rebuilt.
+SCHEMA_VERSION = 3
+
+SCHEMA = """
+CREATE TABLE authors (nickname TEXT PRIMARY KEY, meta TEXT, hash TEXT);
+CREATE TABLE contents (id TEXT, lang TEXT, author TEXT, title TEXT, date TEXT, url TEXT, output TEXT,
+                       hidden INTEGER, meta TEXT, hash TEXT, PRIMARY KEY (id, lang));
+CREATE TABLE tags (tag TEXT, lang TEXT, id TEXT, PRIMARY KEY (tag, lang, id));
+CREATE TABLE links (target TEXT, targetlang TEXT, id TEXT, lang TEXT, PRIMARY KEY (target, targetlang, id, lang));
+CREATE TABLE sources (source TEXT PRIMARY KEY, head TEXT);
+CREATE TABLE state (name TEXT PRIMARY KEY, value TEXT);
+CREATE INDEX contents_date ON contents (hidden, lang, date);
+CREATE INDEX contents_author ON contents (author, lang);
+"""
+
+# Headers not stored as meta. Bodies are large and already in the md files.
+skipped_meta_keys = {"content"}
+
+
+def _json(obj) -> str:
+    return json.dumps(obj, ensure_ascii=False, sort_keys=True, default=str)
+
+
+def _content_row(content) -> tuple:
+    author = content.author
+    return (content.id, content.lang, None if author is None else author.get("nickname"),
+            str(content.get("title", "")), isodate(content.get("date")), content.url,
+            None if content.output is None else str(content.output),
+            int(content.get("publish") is NotImplemented),
+            _json({k: v for k, v in content.meta.items() if k not in skipped_meta_keys}))
+
+
+class ContentDB:
+    """
+    Persistent index of authors, contents per language, tags, links and output paths.
+    """
+
+    def __init__(self, file: Path, log: Logger):
+        self.file = file
+        self.log = log
+        file.parent.mkdir(parents=True, exist_ok=True)
+        # Shards of one build share the file
+        self.db = sqlite3.connect(str(file), timeout=60)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self._migrate()
+
+    def _migrate(self):
+        version = self.db.execute("PRAGMA user_version").fetchone()[0]
+        if version == SCHEMA_VERSION:
+            return
+
+        with self.db:
+            for table in ("authors", "contents", "tags", "links", "sources", "state"):
+                self.db.execute(f"DROP TABLE IF EXISTS {table}")
+            self.db.executescript(SCHEMA)
+            self.db.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+
+    def _state(self, name: str):
+        row = self.db.execute("SELECT value FROM state WHERE name=?", (name,)).fetchone()
+        return None if row is None else row[0]
+
+    def update(self, namespace: dict, heads: dict, settingskey: str = None):
+        """
+        Bring the index in line with namespace. Urls and output files of contents need to be resolved.
+        :param heads: {gitsource: HEAD} of the author repos the namespace was built from
+        :param settingskey: Key of the settings the namespace was built with. Other settings compare all contents.
+        """
+        storedheads = dict(self.db.execute("SELECT source, head FROM sources"))
+        if settingskey is None or self._state("settings") != settingskey:
+            storedheads.clear()
+        unchanged = {source for source, head in heads.items() if head is not None and storedheads.get(source) == head}
+
+        stored = dict(((cid, lang), (rowhash, url, output)) for cid, lang, rowhash, url, output in
+                      self.db.execute("SELECT id, lang, hash, url, output FROM contents"))
+        storedlinks = dict()
+        if unchanged:
+            for cid, lang, target, targetlang in self.db.execute(
+                    "SELECT id, lang, target, targetlang FROM links ORDER BY id, lang, target, targetlang"):
+                storedlinks.setdefault((cid, lang), list()).append((target, targetlang))
+        storedauthors = dict(self.db.execute("SELECT nickname, hash FROM authors"))
+        changed = compared = 0
+
+        with self.db:
+            for nickname, author in namespace["authors"].items():
+                meta = _json(author.meta)
+                rowhash = hashlib.sha1(meta.encode("UTF-8")).hexdigest()
+                if storedauthors.pop(nickname, None) != rowhash:
+                    self.db.execute("INSERT OR REPLACE INTO authors VALUES (?, ?, ?)", (nickname, meta, rowhash))
+
+            for nickname in storedauthors:
+                self.db.execute("DELETE FROM authors WHERE nickname=?", (nickname,))
+
+            for contentl in namespace["contents"].values():
+                for content in contentl.values():
+                    key = content.id, content.lang
+                    links = sorted((other.id, other.lang) for other in content.links)
+                    old = stored.pop(key, None)
+
+                    if old is not None and content.gitsource in unchanged:
+                        # Same headers and tags. Only locations and links may differ.
+                        output = None if content.output is None else str(content.output)
+                        if old[1:] == (content.url, output) and storedlinks.get(key, []) == links:
+                            continue
+
+                    row = _content_row(content)
+                    tags = sorted(content.get("tags") or ())
+                    rowhash = hashlib.sha1(_json((row, tags, links)).encode("UTF-8")).hexdigest()
+                    compared += 1
+
+                    if old is not None and old[0] == rowhash:
+                        continue
+
+                    self._delete(key)
+                    self.db.execute("INSERT INTO contents VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", row + (rowhash,))
+                    self.db.executemany("INSERT OR IGNORE INTO tags VALUES (?, ?, ?)",
+                                        ((tag, content.lang, content.id) for tag in tags))
+                    self.db.executemany("INSERT OR IGNORE INTO links VALUES (?, ?, ?, ?)",
+                                        ((target, targetlang, *key) for target, targetlang in links))
+                    changed += 1
+
+            for key in stored:
+                self._delete(key)
+
+            self.db.execute("DELETE FROM sources")
+            self.db.executemany("INSERT INTO sources VALUES (?, ?)",
+                                ((source, head) for source, head in heads.items() if head is not None))
+            self.db.execute("INSERT OR REPLACE INTO state VALUES ('settings', ?)", (settingskey,))
+
+        self.log.summary("Content index", unchanged_repos=len(unchanged), compared=compared, updated=changed,
+                         deleted=len(stored))
+
+    def _delete(self, key: tuple):
+        self.db.execute("DELETE FROM contents WHERE id=? AND lang=?", key)
+        self.db.execute("DELETE FROM tags WHERE id=? AND lang=?", key)
+        self.db.execute("DELETE FROM links WHERE id=? AND lang=?", key)
+
+    def close(self):
+        self.db.close()
+
+
+class ContentIndex:
+    """
+    Template helper on top of a ContentDB. Queries return the contents of the namespace.
+    """
+
+    def __init__(self, contentdb: ContentDB, contentsl: dict):
+        self.db = contentdb.db
+        self.contentsl = contentsl
+
+    def _contents(self, query: str, args: tuple) -> list:
+        ret = list()
+        for cid, lang in self.db.execute(query, args):
+            content = self.contentsl.get(cid, dict()).get(lang)
+            if content is not None:
+                ret.append(content)
+        return ret
+
+    def latest(self, n: int = 10, tag: str = None, lang: str = None, author: str = None) -> list:
+        "Newest n listed contents by date header, optionally of one tag, language or author nickname"
+        query = "SELECT c.id, c.lang FROM contents c"
+        where, args = ["c.hidden=0"], list()
+        if tag is not None:
+            query += " JOIN tags t ON t.id=c.id AND t.lang=c.lang"
+            where.append("t.tag=?")
+            args.append(tag)
+        if lang is not None:
+            where.append("c.lang=?")
+            args.append(lang)
+        if author is not None:
+            where.append("c.author=?")
+            args.append(author)
+
+        query += " WHERE " + " AND ".join(where) + " ORDER BY c.date DESC, c.id, c.lang LIMIT ?"
+        return self._contents(query, tuple(args) + (n,))
+
+    def tagged(self, tag: str, lang: str = None) -> list:
+        "Listed contents with tag, ordered by id"
+        if lang is None:
+            return self._contents("SELECT c.id, c.lang FROM tags t JOIN contents c ON t.id=c.id AND t.lang=c.lang "
+                                  "WHERE t.tag=? AND c.hidden=0 ORDER BY c.id, c.lang", (tag,))
+        return self._contents("SELECT c.id, c.lang FROM tags t JOIN contents c ON t.id=c.id AND t.lang=c.lang "
+                              "WHERE t.tag=? AND t.lang=? AND c.hidden=0 ORDER BY c.id", (tag, lang))
+
+    def tags(self, lang: str = None) -> list:
+        "(tag, number of listed contents), most used first"
+        query = "SELECT t.tag, COUNT(*) AS n FROM tags t JOIN contents c ON t.id=c.id AND t.lang=c.lang " \
+                "WHERE c.hidden=0"
+        args = ()
+        if lang is not None:
+            query += " AND t.lang=?"
+            args = (lang,)
+        return list(self.db.execute(query + " GROUP BY t.tag ORDER BY n DESC, t.tag", args))
+
+    def backlinks(self, content) -> list:
+        "Contents linking to content"
+        return self._contents("SELECT id, lang FROM links WHERE target=? AND targetlang=? ORDER BY id, lang",
+                              (content.id, content.lang))
@@ -36,8 +36,8 @@ class DirFiles:
             ret = dict()
 
             if with_folders or level < maxdepth:
-                # Iterate folders
-                for d in directory.iterdir():
+                # Iterate folders. Sorted for the same order on every machine.
+                for d in sorted(directory.iterdir()):
                     if d.is_dir():
                         if hidden_folders or not self.hidden_file_func(d):
                             if with_folders:
@@ -48,7 +48,7 @@ class DirFiles:
 
             # Files
             if with_files:
-                for f in directory.iterdir():
+                for f in sorted(directory.iterdir()):
                     if f.is_file():
                         if hidden_files or not self.hidden_file_func(f):
                             ret[key(f)] = f
@@ -26,3 +26,27 @@ def parse_md_file(path: Path) -> Tuple[dict, str]:
 
     finally:
         loader.dispose()
+
+
+# Stands in for bodies not sent back by parse_md_batch()
+BODY_NOT_LOADED = "\0"
+
+
+def parse_md_batch(files: list, log=None, bodies: bool = True) -> list:
+    """
+    Results of parse_md_file for each of files. Worker of process pools.
+    Errors are returned instead of raised, so one bad file does not cost the rest of the batch.
+    Without bodies a non empty body is returned as BODY_NOT_LOADED. Lazy bodies are read again on render anyway.
+    """
+    results = list()
+    for file in files:  # type: Path
+        if log is not None:
+            log.debug("Parsing %s", file)
+        try:
+            headers, body = parse_md_file(file)
+            if not bodies:
+                body = BODY_NOT_LOADED if body.strip() else ""
+            results.append((headers, body))
+        except Exception as e:
+            results.append(e)
+    return results
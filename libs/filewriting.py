@@ -0,0 +1,66 @@
+import filecmp
+import os
+import tempfile
+from pathlib import Path
+
+# Temporary files get the permissions of files created by open()
+_umask = os.umask(0)
+os.umask(_umask)
+
+
+def _tmpfile(path: Path) -> tuple:
+    """
+    (fd, name) of a new temporary sibling of path. Unique per call,
+    so processes writing the same file at the same time never share one.
+    """
+    fd, tmp = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=str(path.parent))
+    os.chmod(tmp, 0o666 & ~_umask)
+    return fd, tmp
+
+
+def write_atomic(path: Path, data: bytes):
+    "Write data to a temporary sibling first and move it over path, so readers never see partial files."
+    fd, tmp = _tmpfile(path)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, str(path))
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class ReplaceIfChanged:
+    """
+    Context manager streaming text into a temporary sibling of path.
+    On exit path is replaced only if the new content differs. Unchanged files keep their timestamps.
+    Afterwards self.changed tells if path has been (re)written.
+    """
+
+    def __init__(self, path: Path, encoding: str = "UTF-8", errors: str = None):
+        self.path = path
+        self.encoding = encoding
+        self.errors = errors
+        self.changed = False
+        self._tmp = None
+        self._f = None
+
+    def __enter__(self):
+        fd, self._tmp = _tmpfile(self.path)
+        self._f = os.fdopen(fd, "w", encoding=self.encoding, errors=self.errors)
+        return self._f
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._f.close()
+
+        if exc_type is not None:
+            # Keep old file on errors
+            os.unlink(self._tmp)
+        elif self.path.is_file() and filecmp.cmp(self._tmp, str(self.path), shallow=False):
+            # Same content
+            os.unlink(self._tmp)
+        else:
+            os.replace(self._tmp, str(self.path))
+            self.changed = True
+
+        return False
@@ -0,0 +1,115 @@
+"""
+Reading of git metadata straight from the .git folder.
+Cheaper than opening a repo with GitPython for simple questions like "which commit is HEAD?".
+"""
+import re
+import subprocess
+from pathlib import Path
+from typing import Union
+
+is_sha = re.compile(r"^[0-9a-f]{40}([0-9a-f]{24})?$")
+config_section = re.compile(r'^\[\s*([^\s\]"]+)(?:\s+"(.*)")?\s*\]$')
+
+
+def git_dir(path: Path) -> Path:
+    "The .git folder of a work tree. Follows .git files of linked work trees and submodules."
+    dotgit = path / ".git"
+    if dotgit.is_file():
+        line = dotgit.read_text(encoding="UTF-8").strip()
+        if line.startswith("gitdir:"):
+            target = Path(line[7:].strip())
+            return target if target.is_absolute() else path / target
+    return dotgit
+
+
+def _common_dir(gitdir: Path) -> Path:
+    "Shared folder of refs and config of linked work trees"
+    commondir = gitdir / "commondir"
+    if commondir.is_file():
+        target = Path(commondir.read_text(encoding="UTF-8").strip())
+        return target if target.is_absolute() else gitdir / target
+    return gitdir
+
+
+def resolve_ref(gitdir: Path, ref: str, depth: int = 5) -> Union[str, None]:
+    "SHA of ref like 'refs/heads/master' from loose refs or packed-refs"
+    for folder in dict.fromkeys((gitdir, _common_dir(gitdir))):
+        loose = folder / ref
+        if loose.is_file():
+            value = loose.read_text(encoding="UTF-8").strip()
+            if value.startswith("ref: ") and depth:
+                return resolve_ref(gitdir, value[5:], depth - 1)
+            return value if is_sha.match(value) else None
+
+    packed = _common_dir(gitdir) / "packed-refs"
+    if packed.is_file():
+        with open(str(packed), encoding="UTF-8") as f:
+            for line in f:
+                if line.startswith(("#", "^")):
+                    continue
+                sha, _, name = line.rstrip("\n").partition(" ")
+                if name == ref:
+                    return sha
+
+    return None
+
+
+def read_head(path: Path) -> Union[str, None]:
+    "SHA of the checked out commit of work tree path. None if unknown."
+    try:
+        gitdir = git_dir(path)
+        head = (gitdir / "HEAD").read_text(encoding="UTF-8").strip()
+        if head.startswith("ref: "):
+            return resolve_ref(gitdir, head[5:])
+        return head if is_sha.match(head) else None
+    except OSError:
+        return None
+
+
+def read_remote_url(path: Path, remote: str = "origin") -> Union[str, None]:
+    "First url of remote from the repo config. None if there is no such remote."
+    try:
+        config = _common_dir(git_dir(path)) / "config"
+        with open(str(config), encoding="UTF-8") as f:
+            insection = False
+            for line in f:
+                line = line.strip()
+                if line.startswith("["):
+                    m = config_section.match(line)
+                    insection = m is not None and m.group(1).lower() == "remote" and m.group(2) == remote
+                elif insection:
+                    key, sep, value = line.partition("=")
+                    if sep and key.strip().lower() == "url":
+                        return value.strip().strip('"')
+    except OSError:
+        pass
+
+    return None
+
+
+def commit_times(path: Path) -> dict:
+    """
+    Unix time of the latest commit touching each file of work tree path, from a single git log call.
+    Key "" holds the time of HEAD. Empty if git fails.
+    """
+    try:
+        res = subprocess.run(("git", "-C", str(path), "-c", "core.quotepath=off", "log", "--format=%x00%ct",
+                              "--name-only", "HEAD"),
+                             stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True)
+    except OSError:
+        return dict()
+
+    if res.returncode:
+        return dict()
+
+    times = dict()
+    current = None
+    for line in res.stdout.splitlines():
+        if line.startswith("\0"):
+            current = int(line[1:])
+            times.setdefault("", current)
+        elif line and current is not None:
+            # Log is newest first
+            times.setdefault(line, current)
+
+    return times
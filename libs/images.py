@@ -0,0 +1,216 @@
+import hashlib
+import io
+import json
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from libs.filecopying import PathC
+from libs.filewriting import write_atomic
+from libs.streamlogging import Logger
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+DEFAULT_SETTINGS = {
+    "widths": (480, 960, 1920),  # Derivative widths. Never upscaled.
+    "webp": True,  # Additional WebP derivative of each width
+    "quality": 80,
+}
+
+# Pillow format and mime type of source images by file extension. Animated gifs stay untouched.
+FORMATS = {
+    ".jpg": ("JPEG", "image/jpeg"),
+    ".jpeg": ("JPEG", "image/jpeg"),
+    ".png": ("PNG", "image/png"),
+    ".webp": ("WEBP", "image/webp"),
+}
+
+META_FILE = "meta.json"
+INDEX_FILE = "index.json"
+
+
+def _save(img, path: Path, fmt: str, **options):
+    "Encode in memory and replace path atomically. Parallel builds may derive the same image."
+    buf = io.BytesIO()
+    img.save(buf, fmt, **options)
+    write_atomic(path, buf.getvalue())
+
+
+def _derive(job: tuple) -> dict:
+    """
+    Worker: Create all derivatives of one source image in folder and write their meta data.
+    meta.json is written last and marks a complete cache entry.
+    Returns the meta data or an error message.
+    """
+    source, folder, widths, webp, quality = job
+    source = Path(source)
+    folder = Path(folder)
+    fmt, mime = FORMATS[source.suffix.lower()]
+
+    try:
+        folder.mkdir(parents=True, exist_ok=True)
+        derivatives = list()
+
+        with Image.open(str(source)) as img:
+            img = ImageOps.exif_transpose(img)
+            width, height = img.size
+
+            for w in sorted(set(widths)):
+                if w >= width:
+                    continue
+
+                h = max(1, round(height * w / width))
+                resized = img.resize((w, h), Image.LANCZOS)
+
+                if fmt != "WEBP":
+                    name = f"{source.stem}-{w}w{source.suffix}"
+                    if fmt == "JPEG":
+                        _save(resized.convert("RGB"), folder / name, fmt, quality=quality, optimize=True,
+                              progressive=True)
+                    else:
+                        _save(resized, folder / name, fmt, optimize=True)
+                    derivatives.append({"file": name, "width": w, "height": h, "type": mime})
+
+                if webp or fmt == "WEBP":
+                    name = f"{source.stem}-{w}w.webp"
+                    _save(resized, folder / name, "WEBP", quality=quality, method=6)
+                    derivatives.append({"file": name, "width": w, "height": h, "type": "image/webp"})
+
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {e}"}
+
+    meta = {"width": width, "height": height, "derivatives": derivatives}
+    write_atomic(folder / META_FILE, json.dumps(meta).encode("UTF-8"))
+    return meta
+
+
+class ImageDerivatives:
+    """
+    Creates resized and WebP derivatives of content images and records their intrinsic dimensions.
+    Derivatives are cached by hash of source and settings, so unchanged images are never encoded again.
+
+    Templates get content.images:
+        {filename: {"width", "height", "srcset": {type: srcset}, "derivatives": [{"file", "width", "height", "type"}]}}
+    """
+
+    def __init__(self, cachedir: Path, settings: dict, log: Logger, workers: int = None):
+        self.cachedir = cachedir
+        self.settings = DEFAULT_SETTINGS.copy()
+        if isinstance(settings, dict):
+            self.settings.update(settings)
+        self.log = log
+        self.workers = workers
+        self._settingskey = json.dumps(self.settings, sort_keys=True).encode("UTF-8")
+
+    def _load_index(self) -> dict:
+        indexfile = self.cachedir / INDEX_FILE
+        if indexfile.is_file():
+            try:
+                return json.loads(indexfile.read_text(encoding="UTF-8"))
+            except ValueError:
+                pass
+        return dict()
+
+    def _cachekey(self, file: PathC, index: dict, newindex: dict) -> str:
+        "Hash of source and settings. Source hashes are remembered by size and mtime to avoid reading."
+        st = file.stat()
+        stamp = [st.st_size, st.st_mtime_ns]
+        known = index.get(str(file))
+        if known is not None and known[0] == stamp:
+            sourcehash = known[1]
+        else:
+            sourcehash = hashlib.sha1(file.read_bytes()).hexdigest()
+        newindex[str(file)] = [stamp, sourcehash]
+
+        h = hashlib.sha1(self._settingskey)
+        h.update(file.name.encode("UTF-8"))
+        h.update(sourcehash.encode("ascii"))
+        return h.hexdigest()
+
+    def process(self, namespace: dict):
+        if Image is None:
+            self.log.warn("Feature files:images needs Pillow (PyPI: Pillow). Skipped.")
+            return
+
+        self.cachedir.mkdir(parents=True, exist_ok=True)
+        index = self._load_index()
+        newindex = dict()
+
+        # Each source image once, even if used by multiple languages
+        folders = dict()  # source -> cache folder
+        for contentl in namespace["contents"].values():
+            for content in contentl.values():
+                for file in content["files"] or ():  # type: PathC
+                    if file.suffix.lower() in FORMATS and file not in folders:
+                        key = self._cachekey(file, index, newindex)
+                        folders[file] = self.cachedir / key[:2] / key
+
+        metas = dict()
+        jobs = list()
+        for file, folder in folders.items():
+            metafile = folder / META_FILE
+            if metafile.is_file():
+                metas[file] = json.loads(metafile.read_text(encoding="UTF-8"))
+            else:
+                jobs.append((file, (str(file), str(folder), self.settings["widths"], self.settings["webp"],
+                                    self.settings["quality"])))
+
+        if jobs:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                for (file, _), result in zip(jobs, pool.map(_derive, [job for _, job in jobs])):
+                    if "error" in result:
+                        self.log.warn(f"Image skipped: {file}: {result['error']}")
+                    else:
+                        metas[file] = result
+
+        # Assign to contents and copy derivatives along with the sources
+        for contentl in namespace["contents"].values():
+            for content in contentl.values():
+                images = dict()
+                derivatives = set()
+                names = {file.name for file in content["files"] or ()}  # Names taken in the output folder
+                for file in sorted(content["files"] or ()):
+                    if file not in metas:
+                        continue
+
+                    meta = metas[file]
+                    srcset = dict()
+                    kept = list()
+                    for d in meta["derivatives"]:
+                        if d["file"] in names:
+                            self.log.warn(f"Image derivative {d['file']} of {file} collides with another file of "
+                                          f"{content!r}. Skipped.")
+                            continue
+                        names.add(d["file"])
+                        kept.append(d)
+                        srcset.setdefault(d["type"], list()).append(f"{d['file']} {d['width']}w")
+                        derivatives.add(PathC(folders[file] / d["file"]))
+
+                    images[file.name] = dict(meta, derivatives=kept,
+                                             srcset={mime: ", ".join(s) for mime, s in srcset.items()})
+
+                if images:
+                    content["images"] = images
+                    content.files = content.files.union(derivatives)
+
+        write_atomic(self.cachedir / INDEX_FILE, json.dumps(newindex).encode("UTF-8"))
+        self.prune(set(folders.values()))
+        self.log.out(f"Images: {len(folders)} sources, {len(jobs)} encoded, {len(folders) - len(jobs)} from cache.")
+
+    def prune(self, used: set):
+        "Delete cache entries of images not used by this build and empty folders"
+        for folder in self.cachedir.iterdir():
+            if not folder.is_dir():
+                continue
+
+            for entry in folder.iterdir():
+                if entry not in used:
+                    shutil.rmtree(str(entry), ignore_errors=True)
+
+            try:
+                folder.rmdir()
+            except OSError:
+                pass  # Not empty
@@ -0,0 +1,175 @@
+import hashlib
+import json
+from concurrent.futures import ProcessPoolExecutor
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import Union
+from urllib.parse import urljoin, urlsplit, unquote
+
+from libs.filecopying import PathC
+from libs.filewriting import write_atomic
+from libs.streamlogging import Logger
+
+PAGE_EXTENSIONS = {".html", ".htm"}
+
+# Attributes holding a single URL
+URL_ATTRS = {"href", "src", "poster"}
+
+# Attributes holding a list of "url width" candidates
+SRCSET_ATTRS = {"srcset", "imagesrcset"}
+
+CHUNK_SIZE = 1 << 16
+
+
+class LinkExtractor(HTMLParser):
+    "Collects all referenced URLs and the <base href> of a page"
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.base = None
+        self.links = list()
+
+    def handle_starttag(self, tag, attrs):
+        for name, value in attrs:
+            if not value:
+                continue
+
+            if tag == "base" and name == "href":
+                if self.base is None:
+                    self.base = value
+            elif name in URL_ATTRS:
+                self.links.append(value)
+            elif name in SRCSET_ATTRS:
+                for candidate in value.split(","):
+                    url = candidate.strip().split(" ")[0]
+                    if url:
+                        self.links.append(url)
+
+
+def _scan_page(job: tuple) -> tuple:
+    """
+    Worker: Extract links of a page if its hash differs from oldhash. The page is read in chunks.
+    Returns (hash, base, links) or (hash, None, None) for unchanged pages.
+    """
+    path, oldhash = job
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            h.update(chunk)
+    h = h.hexdigest()
+    if h == oldhash:
+        return h, None, None
+
+    # Second pass only for changed pages. Memory does not depend on page size.
+    parser = LinkExtractor()
+    with open(path, encoding="UTF-8", errors="replace") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), ""):
+            parser.feed(chunk)
+    parser.close()
+
+    return h, parser.base, parser.links
+
+
+class LinkChecker:
+    """
+    Checks internal links of all written pages against the files of the build and the static folders.
+    Extracted links are remembered by page hash, so only changed pages get parsed again.
+    Links of unchanged pages are still checked, because their targets may have vanished.
+    """
+
+    def __init__(self, webroot: PathC, baseaddress: str, staticdirs: set, index_file: str, statefile: Path,
+                 log: Logger, workers: int = None):
+        self.webroot = webroot
+        self.netloc = urlsplit(baseaddress).netloc
+        self.staticdirs = list()
+        for staticdir in staticdirs:  # type: Path
+            try:
+                self.staticdirs.append(str(staticdir.relative_to(webroot)))
+            except ValueError:
+                pass  # Not served below webroot
+        self.index_file = index_file
+        self.statefile = statefile
+        self.log = log
+        self.workers = workers
+
+    def _load_state(self) -> dict:
+        if self.statefile.is_file():
+            try:
+                return json.loads(self.statefile.read_text(encoding="UTF-8"))
+            except ValueError:
+                pass
+        return dict()
+
+    def target(self, pageid: str, base: Union[str, None], href: str) -> Union[str, None]:
+        "File path relative to webroot of an internal link. None for external links."
+        pageurl = f"http://{self.netloc}/{pageid}"
+        if base:
+            pageurl = urljoin(pageurl, base)
+
+        url = urlsplit(urljoin(pageurl, href.strip()))
+        if url.scheme not in ("http", "https") or url.netloc != self.netloc:
+            return None
+
+        return unquote(url.path).lstrip("/")
+
+    def index_of(self, relpath: str) -> str:
+        "Index file served for a folder url"
+        folder = relpath.rstrip("/")
+        return (folder + "/" if folder else "") + self.index_file
+
+    def exists(self, relpath: str, known: dict) -> bool:
+        if relpath in known or self.index_of(relpath) in known:
+            return True
+
+        for staticdir in self.staticdirs:
+            if relpath == staticdir or relpath.startswith(staticdir + "/"):
+                return (self.webroot / relpath).exists()
+
+        return False
+
+    def check(self, touched_files: dict, pages: dict = None) -> int:
+        """
+        Returns number of broken links.
+        pages: {page file: {"id", "lang", "author"}} to report broken links per content and author
+        """
+        oldstate = self._load_state()
+        state = dict()
+
+        pageids = sorted(fileid for fileid, file in touched_files.items()
+                         if PathC(fileid).suffix.lower() in PAGE_EXTENSIONS)
+        jobs = [(str(touched_files[pageid]), oldstate.get(pageid, dict()).get("hash")) for pageid in pageids]
+
+        parsed = 0
+        if jobs:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                for pageid, (h, base, links) in zip(pageids, pool.map(_scan_page, jobs, chunksize=16)):
+                    if links is None:
+                        state[pageid] = oldstate[pageid]
+                        continue
+
+                    parsed += 1
+                    internal = list()
+                    for href in dict.fromkeys(links):
+                        target = self.target(pageid, base, href)
+                        if target is not None:
+                            internal.append((href, target))
+                    state[pageid] = {"hash": h, "links": internal}
+
+        linkcount = broken = 0
+        for pageid in pageids:
+            for href, target in state[pageid]["links"]:
+                linkcount += 1
+                if self.exists(target, touched_files):
+                    continue
+
+                broken += 1
+                page = (pages or dict()).get(pageid)
+                if page is None:
+                    self.log.warn(f"Broken link in {pageid}: {href}")
+                else:
+                    self.log.warn(f"Broken link of author {page['author'] or '?'} in {page['id']} ({page['lang']}): "
+                                  f"{href}")
+
+        write_atomic(self.statefile, json.dumps(state, sort_keys=True).encode("UTF-8"))
+        self.log.summary("Link check", pages=len(pageids), parsed=parsed, links=linkcount, broken=broken)
+        return broken
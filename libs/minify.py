@@ -0,0 +1,119 @@
+import hashlib
+import re
+from pathlib import Path
+
+from libs.filewriting import write_atomic
+from libs.streamlogging import Logger
+
+# Increase on any change of minify_html. Cached results of older versions are not used.
+MINIFY_VERSION = 2
+
+# Attributes of a tag. Quoted values may contain ">" and whitespace.
+tag_attrs = r"""(?:[^>"']|"[^"]*"|'[^']*')*"""
+
+# Contents of these elements stay exactly as they are
+protected_blocks = re.compile(r"(<(pre|textarea|script|style)\b" + tag_attrs + r">.*?</\2\s*>)",
+                              re.DOTALL | re.IGNORECASE)
+
+# Comments except conditional comments <!--[if IE]>
+html_comments = re.compile(r"<!--(?!\[if).*?-->", re.DOTALL)
+
+whitespace = re.compile(r"\s+")
+
+tags = re.compile(r"(<[a-zA-Z/!]" + tag_attrs + ">)")
+
+# Quoted attribute values are kept, whitespace between attributes collapsed
+quoted_or_whitespace = re.compile(r"""("[^"]*"|'[^']*')|\s+""")
+
+# Whitespace around tags of these elements is never rendered
+block_tags = re.compile(r"\s*(</?(?:html|head|body|meta|link|title|base|div|p|ul|ol|li|dl|dt|dd|table|thead|tbody|tfoot"
+                        r"|tr|td|th|section|article|aside|header|footer|nav|main|figure|figcaption|form|fieldset"
+                        r"|h[1-6]|br|hr|!doctype)\b" + tag_attrs + r">)\s*", re.IGNORECASE)
+
+
+def _collapse(text: str) -> str:
+    "Collapse whitespace of text and inside its tags, but not within quoted attribute values"
+    parts = tags.split(text)
+    for i in range(0, len(parts), 2):
+        parts[i] = whitespace.sub(" ", parts[i])
+        if i + 1 < len(parts):
+            parts[i + 1] = quoted_or_whitespace.sub(lambda m: m.group(1) or " ", parts[i + 1])
+    return "".join(parts)
+
+
+def minify_html(html: str) -> str:
+    """
+    Remove comments and collapse whitespace outside of pre, textarea, script and style elements.
+    Quoted attribute values stay untouched.
+    """
+    parts = protected_blocks.split(html)
+    ret = list()
+
+    # split() yields: text, block, tagname, text, block, tagname, ..., text
+    for i in range(0, len(parts), 3):
+        text = html_comments.sub("", parts[i])
+        text = _collapse(text)
+        text = block_tags.sub(r"\1", text)
+        ret.append(text)
+
+        if i + 1 < len(parts):
+            ret.append(parts[i + 1])
+
+    return "".join(ret).strip()
+
+
+class HtmlMinifier:
+    """
+    Minifies rendered pages. Results are cached by hash of the rendered html and MINIFY_VERSION,
+    so unchanged pages are not minified again.
+    """
+
+    def __init__(self, cachedir: Path, log: Logger):
+        self.cachedir = cachedir
+        self.log = log
+        self.used = set()
+        self.pages = 0
+        self.hits = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def minify(self, html: str) -> str:
+        data = html.encode("UTF-8", errors="xmlcharrefreplace")
+        key = hashlib.sha1(b"%d\n" % MINIFY_VERSION + data).hexdigest()
+        cachefile = self.cachedir / key[:2] / f"{key}.html"
+        self.used.add(cachefile)
+
+        if cachefile.is_file():
+            minified = cachefile.read_bytes()
+            self.hits += 1
+        else:
+            minified = minify_html(html).encode("UTF-8", errors="xmlcharrefreplace")
+            cachefile.parent.mkdir(parents=True, exist_ok=True)
+            write_atomic(cachefile, minified)
+
+        self.pages += 1
+        self.bytes_in += len(data)
+        self.bytes_out += len(minified)
+
+        return minified.decode("UTF-8")
+
+    def prune(self):
+        "Delete cached results not used by this build and empty folders"
+        if not self.cachedir.is_dir():
+            return
+
+        for folder in self.cachedir.iterdir():
+            for cachefile in folder.iterdir():
+                if cachefile not in self.used:
+                    cachefile.unlink()
+
+            try:
+                folder.rmdir()
+            except OSError:
+                pass  # Not empty
+
+    def report(self):
+        saved = self.bytes_in - self.bytes_out
+        percent = saved * 100 / self.bytes_in if self.bytes_in else 0
+        self.log.out(f"Minified {self.pages} pages ({self.hits} from cache): {self.bytes_in} to {self.bytes_out} bytes,"
+                     f" saved {saved} bytes ({percent:.1f}%).")
@@ -0,0 +1,295 @@
+import gc
+import sys
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class Record:
+    """
+    Compact base for authors and contents.
+    Fixed fields are stored in slots, all other meta headers in self.meta.
+    Item and attribute access behave like the former plain dicts, so templates
+    can still use content.title as well as content["title"].
+    """
+    __slots__ = ("meta", "__weakref__")
+
+    # Keys handled by slots or properties instead of self.meta
+    fields = frozenset()
+
+    def __init__(self, meta: dict = None):
+        self.meta = dict() if meta is None else meta
+
+    def __getitem__(self, key: str):
+        if key in self.fields:
+            return getattr(self, key)
+        return self.meta[key]
+
+    def __setitem__(self, key: str, value):
+        if key in self.fields:
+            setattr(self, key, value)
+        else:
+            self.meta[key] = value
+
+    def __delitem__(self, key: str):
+        if key in self.fields:
+            setattr(self, key, None)
+        else:
+            del self.meta[key]
+
+    def _present(self, field: str) -> bool:
+        return getattr(self, field) is not None
+
+    def __contains__(self, key: str) -> bool:
+        if key in self.fields:
+            return self._present(key)
+        return key in self.meta
+
+    def __getattr__(self, name: str):
+        # Only called if no slot or property matched. Fall back to meta headers.
+        if name == "meta":
+            raise AttributeError(name)
+
+        try:
+            return self.meta[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def get(self, key: str, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def pop(self, key: str, *default):
+        return self.meta.pop(key, *default)
+
+    def keys(self):
+        return [key for key in self.fields if self._present(key)] + [key for key in self.meta if key not in self.fields]
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self) -> int:
+        return len(self.keys())
+
+    def _slotnames(self):
+        for cls in type(self).__mro__:
+            for name in cls.__dict__.get("__slots__", ()):
+                if name != "__weakref__":
+                    yield name
+
+    def __getstate__(self) -> dict:
+        "Slot values for pickling"
+        return {name: getattr(self, name) for name in self._slotnames()}
+
+    def __setstate__(self, state: dict):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+
+class LangDict(dict):
+    """
+    Dict of lang -> content.
+    Contents only keep a weak reference to their LangDict, so it needs weakref support.
+    """
+    __slots__ = ("__weakref__",)
+
+
+class Author(Record):
+    __slots__ = ("contents", "gitsources")
+    fields = frozenset(__slots__)
+
+    def __init__(self, meta: dict = None):
+        super().__init__(meta)
+        self.contents = dict()  # {contentid: {lang: content}}
+        self.gitsources = set()
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.meta.get('nickname')!r})"
+
+
+def _deref(ref):
+    return None if ref is None else ref()
+
+
+# Lazy bodies read recently, e.g. by listings rendering the bodies of other contents. Memory stays bounded.
+BODY_CACHE_SIZE = 32
+_bodycache = OrderedDict()  # (bodysource, mtime) -> body
+
+
+class Content(Record):
+    """
+    One content in one language.
+    References to other records are weak, so authors and contents never form reference cycles.
+    """
+    __slots__ = ("id", "lang", "gitsource", "mdsource", "url", "output", "file", "files",
+                 "_author", "_langs", "_links", "_related", "bodysource")
+    fields = frozenset({"id", "lang", "gitsource", "mdsource", "url", "output", "file", "files",
+                        "author", "langs", "otherlangs", "links", "related", "content"})
+
+    # Slots of weak references and their properties. Pickled as the referenced objects.
+    weakslots = {"_author": "author", "_langs": "langs", "_links": "links", "_related": "related"}
+
+    def __init__(self, contentid: str, lang: str, meta: dict = None):
+        super().__init__(meta)
+        # Same ids and language codes are shared across the whole corpus
+        self.id = sys.intern(contentid)
+        self.lang = sys.intern(lang)
+        self.gitsource = None
+        self.mdsource = None
+        self.url = None
+        self.output = None  # Page file relative to webroot
+        self.file = None
+        self.files = None
+        self._author = None
+        self._langs = None
+        self._links = None
+        self._related = None
+        self.bodysource = None  # md file to load the body from lazily
+
+    @property
+    def author(self):
+        return _deref(self._author)
+
+    @author.setter
+    def author(self, author: Author):
+        self._author = None if author is None else weakref.ref(author)
+
+    @property
+    def langs(self):
+        return _deref(self._langs)
+
+    @langs.setter
+    def langs(self, contentl: LangDict):
+        self._langs = None if contentl is None else weakref.ref(contentl)
+
+    @property
+    def otherlangs(self):
+        contentl = self.langs
+        if contentl is None:
+            return None
+        return {lang: c for lang, c in contentl.items() if c is not self}
+
+    @otherlangs.setter
+    def otherlangs(self, value):
+        raise AttributeError("otherlangs is derived from langs")
+
+    @property
+    def links(self) -> list:
+        if self._links is None:
+            return []
+        return [c for c in (ref() for ref in self._links) if c is not None]
+
+    @links.setter
+    def links(self, contents):
+        self._links = None
+        for c in contents or ():
+            self.add_link(c)
+
+    def add_link(self, content: "Content"):
+        "Link another content. Has no effect if already linked."
+        if self._links is None:
+            self._links = [weakref.ref(content)]
+            return
+
+        for ref in self._links:
+            if ref() is content:
+                return
+
+        self._links.append(weakref.ref(content))
+
+    @property
+    def related(self) -> list:
+        if self._related is None:
+            return []
+        return [c for c in (ref() for ref in self._related) if c is not None]
+
+    @related.setter
+    def related(self, contents):
+        self._related = [weakref.ref(c) for c in contents] if contents else None
+
+    def _present(self, field: str) -> bool:
+        if field == "content":
+            # Without reading a lazy body
+            return "content" in self.meta or self.bodysource is not None
+        return super()._present(field)
+
+    def _read_body(self) -> str:
+        # Edited files are read again
+        key = self.bodysource, self.bodysource.stat().st_mtime_ns
+        body = _bodycache.get(key)
+        if body is None:
+            from libs.fileparser import parse_md_file
+            _, body = parse_md_file(self.bodysource)
+            body = body.strip()
+
+            _bodycache[key] = body
+            while len(_bodycache) > BODY_CACHE_SIZE:
+                _bodycache.popitem(last=False)
+        else:
+            _bodycache.move_to_end(key)
+        return body
+
+    @property
+    def content(self):
+        "Body of content. Lazy bodies are read from bodysource if not loaded. Recently read bodies are cached."
+        if "content" in self.meta:
+            return self.meta["content"]
+        if self.bodysource is None:
+            return None
+        return self._read_body()
+
+    @content.setter
+    def content(self, body: str):
+        self.meta["content"] = body
+
+    def load_body(self):
+        "Keep a lazy body in memory until release_body()"
+        if self.bodysource is not None and "content" not in self.meta:
+            self.meta["content"] = self._read_body()
+
+    def release_body(self):
+        if self.bodysource is not None:
+            self.meta.pop("content", None)
+
+    def __getstate__(self) -> dict:
+        state = super().__getstate__()
+        for slot, prop in self.weakslots.items():
+            state[slot] = getattr(self, prop)
+        return state
+
+    def __setstate__(self, state: dict):
+        for name, value in state.items():
+            setattr(self, self.weakslots.get(name, name), value)
+        self.id = sys.intern(self.id)
+        self.lang = sys.intern(self.lang)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.id!r}, {self.lang!r})"
+
+
+@contextmanager
+def build_gc(threshold: int = 50000):
+    """
+    Tune the cyclic garbage collector for a build.
+    All objects alive before the build are frozen and the first generation threshold is raised,
+    because the build creates lots of acyclic objects which don't need to be scanned repeatedly.
+    """
+    oldthreshold = gc.get_threshold()
+    can_freeze = hasattr(gc, "freeze")  # Python 3.7+
+
+    gc.collect()
+    if can_freeze:
+        gc.freeze()
+    gc.set_threshold(threshold, *oldthreshold[1:])
+
+    try:
+        yield
+    finally:
+        gc.set_threshold(*oldthreshold)
+        if can_freeze:
+            gc.unfreeze()
+        gc.collect()
@@ -3,14 +3,12 @@ import sys
 from pathlib import Path
 
 from libs.filecopying import PathC
-from libs.pagecontent import PageContent
-from libs.repo import RepoDir
-from libs.streamlogging import Logger
+from libs.streamlogging import Logger, INFO
 from libs.abs.pageconfig import PageConfig
 
 
 class Page:
-    def __init__(self, config, pageconfig: PageConfig, logger: Logger = None):
+    def __init__(self, config, pageconfig: PageConfig, logger: Logger = None, loglevel: int = INFO):
         self.config = config
         self.pageconfig = pageconfig
         self._check_pagepaths()
@@ -22,16 +20,24 @@ class Page:
 
             if isinstance(logfile, Path):
                 stream = open(str(logfile), "w")
-                self.log = Logger(stream, stream, stream)
+                self.log = Logger(stream, stream, stream, level=loglevel, buffered=True)
             else:
                 # Use stdout from process if no logfile configured.
-                self.log = Logger(sys.stdout, sys.stdout, sys.stderr)
-
-        self.contentgen = PageContent(
-            self.config,
-            self.pageconfig,
-            self.log.sublogger("CONTENT")
-        )
+                self.log = Logger(sys.stdout, sys.stdout, sys.stderr, level=loglevel)
+
+        self._contentgen = None
+
+    @property
+    def contentgen(self):
+        "Content generator. Imported on first use."
+        if self._contentgen is None:
+            from libs.pagecontent import PageContent
+            self._contentgen = PageContent(
+                self.config,
+                self.pageconfig,
+                self.log.sublogger("CONTENT")
+            )
+        return self._contentgen
 
     def fail(self, text: str):
         "Raise an Exception and quit application"
@@ -64,6 +70,7 @@ class Page:
             self.clone_by_key(key, gitid, url)
 
     def open_repos_by_key(self, key: str) -> dict:
+        from libs.repo import RepoDir
         ret = dict()
 
         clonefolder = self.pageconfig.CLONE_DESTINATIONS[key]
@@ -89,6 +96,8 @@ class Page:
 
         try:
             for cmd in cmds:
+                # git writes into the same stream
+                self.log.flush()
                 res = subprocess.run(cmd, stdout=self.log._out, stderr=self.log._out)  # TODO: iowrapper
                 if res.returncode:
                     self.log.err(f"git command returned {res.returncode}")
@@ -101,6 +110,19 @@ class Page:
         directory = PathC(self.pageconfig.CLONE_DESTINATIONS[key]) / gitid
         self.clone(gitid, directory, url)
 
-    def generate_content(self, onlywhenchanged: bool = True):
-        repos = {key: self.open_repos_by_key(key) for key in self.pageconfig.GIT_SOURCES.keys()}
-        self.contentgen.generate(repos, onlywhenchanged)
+    def open_repos(self) -> dict:
+        return {key: self.open_repos_by_key(key) for key in self.pageconfig.GIT_SOURCES.keys()}
+
+    def generate_content(self, onlywhenchanged: bool = True, shard: tuple = None, outputdir: Path = None,
+                         selectors: dict = None):
+        self.contentgen.generate(self.open_repos(), onlywhenchanged, shard, outputdir, selectors)
+        self.log.flush()
+
+    def serve(self, host: str, port: int):
+        "Local preview of the current clones"
+        from libs.preview import PreviewSite
+        PreviewSite(self.contentgen, self.open_repos(), self.log.sublogger("PREVIEW")).serve(host, port)
+
+    def merge_shards(self, count: int):
+        self.contentgen.merge_shards(self.open_repos(), count)
+        self.log.flush()
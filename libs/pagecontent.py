@@ -1,18 +1,29 @@
-from pathlib import Path, PurePath
-from typing import Tuple, Dict, Union
+from pathlib import Path, PurePath, PurePosixPath
+from typing import Tuple, Dict, Union, TYPE_CHECKING
 from libs.filecopying import PathC
 import re
+import sys
+import filecmp
 import datetime
 import traceback
 from config import Config
-from libs.content import ContentGenerator
 from libs.dirtools import DirFiles
-from libs.repo import RepoDir
-from libs.fileparser import parse_md_file
-from libs.setofmutable import SetOfMutable
-from libs.streamlogging import Logger
+from libs.filewriting import ReplaceIfChanged
+from libs.model import Author, Content, LangDict, build_gc
+from libs.pagestate import PageState
+from libs.shards import in_shard, is_global_shard, write_manifest, read_manifests, remove_manifests
+from libs.minify import HtmlMinifier
+from libs.searchindex import SearchIndex
+from libs.sitemap import SitemapWriter
+from libs.writerpool import OutputWriter
+from libs.streamlogging import Logger, DEBUG
 from urllib import parse
 
+# Modules importing git, yaml, jinja2, markdown, numpy or Pillow are imported by the stages using them.
+# Runs without changes end before any of them gets loaded.
+if TYPE_CHECKING:
+    from libs.repo import RepoDir
+
 
 AUTHORMETA_FILE = "author/meta.md"
 
@@ -32,18 +43,33 @@ reserved_author_meta_keys = {"contents", "langs", "gitsources"}
 required_content_keys = {"title", "date", "description"}
 
 # Predefined meta headers will be removed
-reserved_content_keys = {"lang", "langs", "otherlangs", "gitsource", "mdsource", "author", "url",
-                         "id", "links", "file", "files"}
+reserved_content_keys = {"lastcommit", "lang", "langs", "otherlangs", "gitsource", "mdsource", "author", "url",
+                         "output", "id", "links", "file", "files", "related", "images"}
 
 basemodels = "content.html", "author.html"
 
+# Parallel parsing of md files starts with this number of files. Smaller sites are faster without a pool.
+PARSE_MIN_FILES = 200
+PARSE_BATCH_SIZE = 32
+
+# Processed HEADs of all repos, below pageconfig.ROOT
+STATE_FILE = "state.json"
+
+# Namespace snapshot, below pageconfig.ROOT / "cache"
+SNAPSHOT_FILE = "namespace.pickle"
+
+# Features changing the namespace. Others, like output or checks, keep the snapshot valid.
+NAMESPACE_FEATURES = ("content:", "files:copy:", "files:images", "render:streaming", "output:deterministic")
 
-def _getcreate_subdict(dictcollection: dict, key: str, garbage: list) -> dict:
+# SQLite content index, below pageconfig.ROOT
+CONTENTDB_FILE = "contents.sqlite"
+
+
+def _getcreate_subdict(dictcollection: dict, key: str) -> dict:
     if key in dictcollection:
         return dictcollection[key]
 
     d = dictcollection[key] = dict()
-    garbage.append(d)
     return d
 
 
@@ -80,20 +106,76 @@ def get_orphan_files(files_before: dict, files_touched: dict) -> dict:
     return {orphan: files_before[orphan] for orphan in orphans}
 
 
+def content_location(contentsettings: dict, cid: str, clang: str) -> Tuple[PurePosixPath, PurePosixPath, str]:
+    """
+    Output folder and file relative to webroot and url of content cid in language clang.
+    Empty clang: Folder shared by all languages of cid and quoted cid.
+    """
+    deflang = contentsettings.get("LANG_DEFAULT", "en")
+    index_only = contentsettings.get("INDEX_ONLY", False)
+    index_file = contentsettings.get("INDEX_FILE", "index.html")
+    file_extension = contentsettings.get("CONTENT_FILE_EXTENSION", ".html")
+    spreplchar = contentsettings.get("SPACE_REPLACE", "-")
+
+    if type(spreplchar) is str:
+        cid_for_urlquote = cid.replace(" ", spreplchar)
+    else:
+        cid_for_urlquote = cid
+
+    if index_only:
+        # python/learn/index.html
+        # python/learn/en/index.html
+        if not clang or clang == deflang:
+            rfolder = PurePosixPath(cid)
+            rurl = parse.quote(f"/{cid_for_urlquote}")
+        else:
+            rfolder = PurePosixPath(cid, clang)
+            rurl = parse.quote(f"/{cid_for_urlquote}/{clang}")
+        rfile = rfolder / index_file
+
+    else:
+        # python/learn.html
+        # python/learn-en.html
+        vfolder = PurePosixPath(cid)
+        rfolder = vfolder.parent
+        fname = vfolder.name
+
+        if not clang or clang == deflang:
+            rfile = rfolder / f"{fname}{file_extension}"
+            rurl = parse.quote(f"/{cid_for_urlquote}{file_extension}")
+        else:
+            rfile = rfolder / f"{fname}-{clang}{file_extension}"
+            rurl = parse.quote(f"/{cid_for_urlquote}-{clang}{file_extension}")
+
+    if not clang:
+        return rfolder, rfile, parse.quote(cid)
+
+    return rfolder, rfile, rurl
+
+
 class PageContent:
     def __init__(self, config: Config, pageconfig, logger: Logger = None):
         self.config = config
         self.pageconfig = pageconfig
         self.log = logger
 
-    def need_regenerate(self, repolist: list) -> bool:
+        # Earliest publish date not reached yet. Namespace changes then.
+        self.next_publish: Union[datetime.datetime, None] = None
+
+        # generationtime of namespace. None: now
+        self.buildtime: Union[datetime.datetime, None] = None
+        self._parsed = dict()  # file -> result of parse_md_file() from parse_all()
+
+    def need_regenerate(self, repos: dict, state: PageState) -> bool:
+        "Compare HEADs of all repos with the last processed ones"
         found = False
 
         self.log.out("Checking if sources have updated...")
-        for repo in repolist:  # type: RepoDir
-            if repo.commit_date_newer():
-                self.log.out(f"Repo has updated: {repo.repoid}")
-                found = True
+        for kind, repodict in repos.items():  # type: str, dict
+            for repoid, repo in repodict.items():  # type: str, RepoDir
+                if state.changed(state.key(kind, repoid), repo.head):
+                    self.log.out(f"Repo has updated: {repoid}")
+                    found = True
 
         return found
 
@@ -141,7 +223,7 @@ class PageContent:
             thingcol: dict = collectionl[thingid]
         else:
             # Create thing initially in this language
-            thingcol = collectionl[thingid] = dict()
+            thingcol = collectionl[thingid] = LangDict()
 
         for lang, content in contentl.items():  # type: str, dict
             if lang in thingcol:
@@ -152,14 +234,67 @@ class PageContent:
             # Add language with content
             thingcol[lang] = content
 
-    def read_authors_with_contents(self, authorrepos: dict) -> Tuple[dict, list]:
-        """Read all authors
-        Better deep destroy the result after elements are not used anymore anywhere.
+    def parse_md(self, file: Path) -> Tuple[dict, str]:
+        "Headers and body of file. Taken from parse_all() if already parsed there."
+        result = self._parsed.pop(file, None)
+        if result is None:
+            from libs.fileparser import parse_md_file
+            return parse_md_file(file)
+
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def parse_all(self, authorrepos: dict):
         """
-        ret_repos = dict()  # repoid -> author_meta_dict, contents, gitsource
+        Parse all md files of authorrepos in a process pool, in batches of files of the same repo.
+        Results are only stored. Checks and merging stay in the serial order of the readers.
+        """
+        workers = self.pageconfig.FEATURES.get("read:workers", 0)
+
+        # Lazy bodies are not needed now. Author descriptions in meta files are, so these are read later.
+        bodies = not self.pageconfig.FEATURES.get("render:streaming", False)
+
+        batches = list()
+        for authorrepo in authorrepos.values():  # type: RepoDir
+            files = [file for fpath, file in authorrepo.files.items()
+                     if is_md.match(fpath) or (bodies and fpath == AUTHORMETA_FILE)]
+            batches.extend(files[i:i + PARSE_BATCH_SIZE] for i in range(0, len(files), PARSE_BATCH_SIZE))
+
+        count = sum(len(batch) for batch in batches)
+        if workers < 2 or count < PARSE_MIN_FILES:
+            return
+
+        from concurrent.futures import ProcessPoolExecutor
+        from libs.fileparser import parse_md_batch
+
+        # Debug messages of workers are sent through a queue
+        manager = queue = listener = None
+        if self.log.level <= DEBUG:
+            import multiprocessing
+            manager = multiprocessing.Manager()
+            queue = manager.Queue()
+            listener = self.log.listen(queue)
+        workerlog = None if queue is None else self.log.sublogger("PARSER").worker_logger(queue)
+
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                for batch, results in zip(batches, pool.map(parse_md_batch, batches, [workerlog] * len(batches),
+                                                                [bodies] * len(batches))):
+                    self._parsed.update(zip(batch, results))
+        finally:
+            if manager is not None:
+                queue.put(None)
+                listener.join()
+                manager.shutdown()
+
+        self.log.summary("Parsed in parallel", files=count, batches=len(batches), workers=workers)
+
+    def read_authors_with_contents(self, authorrepos: dict) -> dict:
+        "Read all authors"
+        ret_repos = dict()  # repoid -> author, contents, gitsource
 
-        # Collect all lists and dicts containing references to other objects
-        garbage = list()
+        self.parse_all(authorrepos)
 
         for repoid, authorrepo in authorrepos.items():  # type: str, RepoDir
             files = authorrepo.files
@@ -170,7 +305,7 @@ class PageContent:
 
             # Load meta info of author
             self.log.out(f"Processing meta of author {repoid}.")
-            authormeta, content = parse_md_file(meta)
+            authormeta, content = self.parse_md(meta)
 
             # ### By manipulating the mechanism of contentgrant you violate personal copy rights.                 ###
             # ### Authors may enforce legal steps against you, if you use their content without their permission. ###
@@ -200,7 +335,7 @@ class PageContent:
                 self.log.warn(f"Skipping repo {repoid} because some required header missing in {AUTHORMETA_FILE}.")
 
             # Collect author's self descriptions
-            _getcreate_subdict(authormeta, "content", garbage)  # dict of lang
+            _getcreate_subdict(authormeta, "content")  # dict of lang
 
             # Check content of meta.md
             if len(content.strip()):
@@ -223,7 +358,7 @@ class PageContent:
             for path, file in files.items():  # type: str, Path
                 m = is_author_lang_content.search(path)
                 if m:
-                    self.log.out(f"Parsing author description in {path}")
+                    self.log.debug("Parsing author description in %s", path)
                     lang = m.group(1)
                     self._addmerge("content",
                                    {lang: file.read_text(encoding="UTF-8")},
@@ -232,14 +367,15 @@ class PageContent:
                                    )
 
             # Read author repo's contents
-            contentsl, contentgarbage = self.read_contents(authorrepo)
-            garbage.extend(contentgarbage)
-            garbage.append(authormeta)
+            contentsl = self.read_contents(authorrepo)
 
             # Append meta and content to repo collection
-            ret_repos[repoid] = authormeta, contentsl, authorrepo.origin
+            ret_repos[repoid] = Author(authormeta), contentsl, sys.intern(authorrepo.origin)
 
-        return ret_repos, garbage
+        # Files of skipped repos
+        self._parsed.clear()
+
+        return ret_repos
 
     def replace_headers_basic_inplace(self, headers: dict) -> bool:
         # ### Publish ###
@@ -254,7 +390,9 @@ class PageContent:
 
         if type(publish) in (datetime.datetime, datetime.date):
             if datetime.datetime.now() <= publish:
-                self.log.out(f"Publish date not yet reached: ({publish})")
+                self.log.debug("Publish date not yet reached: (%s)", publish)
+                if self.next_publish is None or publish < self.next_publish:
+                    self.next_publish = publish
                 return False
 
         if type(publish) is str:
@@ -287,16 +425,17 @@ class PageContent:
             self.log.warn(f"Unrecognized value for meta key 'tags': '{tags}'")
             return False
 
-        headers["tags"] = tags
+        # Sorted for the same order in every run
+        headers["tags"] = sorted(tags)
 
         # Linkto, linkwith, sources
         def check_header_links(key: str):
-            # Replace string header in set of contentids
+            # Replace string header in list of unique contentids. Order of author is kept.
             if key not in headers:
                 return
 
             links_str = headers[key]
-            headers[key] = {link.strip() for link in links_str.split(",") if len(link.strip())}
+            headers[key] = list(dict.fromkeys(link.strip() for link in links_str.split(",") if len(link.strip())))
 
         check_header_links("linkto")
         check_header_links("linkwith")
@@ -304,19 +443,17 @@ class PageContent:
 
         return True
 
-    def read_contents(self, authorrepo: RepoDir) -> Tuple[dict, list]:  # of contentid
+    def read_contents(self, authorrepo: "RepoDir") -> dict:  # of contentid
         "Read all contents of an author repo"
-
         ret_contentsl = dict()  # path -> dict of lang -> content
 
-        # Collect all lists and dicts containing references to other objects
-        garbage = list()
-
         files = authorrepo.files
+        gitsource = sys.intern(authorrepo.origin)
 
-        uselinking = self.pageconfig.FEATURES.get("content:linking", True)
         do_copyfiles = self.pageconfig.FEATURES.get("files:copy:other", True)
         do_copyfile = self.pageconfig.FEATURES.get("files:copy:md", False)
+        lazybodies = self.pageconfig.FEATURES.get("render:streaming", False)
+        committimes = authorrepo.commit_times if self.pageconfig.FEATURES.get("output:deterministic", False) else None
 
         def contentlang(path: str):
             # Try match content/*.lang.md files
@@ -326,80 +463,106 @@ class PageContent:
                 match = is_directory_lang_md.search(path)
             return match
 
+        # Assets of each folder, listed once per repo. Contents of the same folder share one frozenset.
+        folderassets = dict()
+        if do_copyfiles:
+            for fpath, file in files.items():  # type: str, Path
+                if not contentlang(fpath):
+                    folderassets.setdefault(file.parent, set()).add(file)
+            folderassets = {folder: frozenset(assets) for folder, assets in folderassets.items()}
+        noassets = frozenset()
+
+        mdfiles = read = 0
         for fpath, file in files.items():  # type: str, Path
             # Try match content/*.md files
             if not is_md.match(fpath):
                 continue
 
+            mdfiles += 1
             m = contentlang(fpath)
             if not m:
                 self.log.warn(f"Skipping content of {fpath} because file does not match naming requirements.")
                 continue
 
             # File path matched one of both patterns
-            self.log.out(f"Reading content of: {fpath}")
-            headers, content = parse_md_file(file)
-            garbage.append(headers)
-            contentid = m.group(1)
-            lang = m.group(2)
+            self.log.debug("Reading content of: %s", fpath)
+            headers, body = self.parse_md(file)
 
             # Sanity checks
             if not self.check_contentmeta(headers):
                 self.log.warn(f"Skipping content of {fpath} because some required meta keys are missing.")
                 continue
 
-            # Create repo related dynamic headers
-            headers["gitsource"] = authorrepo.origin
-            headers["mdsource"] = fpath
-            headers["lang"] = lang
-            headers["id"] = contentid
-
-            if uselinking:
-                headers["links"] = SetOfMutable()  # to add unhashable dicts to a set by id.
-                garbage.append(headers["links"])
-
-            if do_copyfiles:
-                # Track all files in same folder except content files
-                parentfolder = file.parent
-                headers["files"] = set(f for f in parentfolder.iterdir() if f.is_file() and not contentlang(str(f.relative_to(authorrepo.path))))
-
-            if do_copyfile:
-                # Sourcefile itself
-                headers["file"] = file
-
             # Early basic header analysis and translations
             if not self.replace_headers_basic_inplace(headers):
-                self.log.out(f"Skipping content file: {fpath} because of any meta check.")
+                self.log.debug("Skipping content file: %s because of any meta check.", fpath)
                 continue
 
             # Check for exactly one content source in file
             if "content" in headers:
-                if len(content.strip()):
+                if len(body.strip()):
                     self.log.warn(f"Skipping content file: {fpath} having both content in body and in content header.")
                     continue
             else:
-                if len(content.strip()) == 0:
+                if len(body.strip()) == 0:
                     self.log.warn(f"Skipping content file: {fpath}. Missing content.")
                     continue
 
-                # Add content to headers.content
-                headers["content"] = content.strip()
+                if not lazybodies:
+                    # Add content to headers.content
+                    headers["content"] = body.strip()
+
+            content = Content(m.group(1), m.group(2), headers)
+            if "content" not in headers:
+                # Body gets loaded again on render
+                content.bodysource = file
+
+            # Create repo related dynamic headers
+            content.gitsource = gitsource
+            content.mdsource = fpath
+
+            if do_copyfiles:
+                # Track all files in same folder except content files
+                content.files = folderassets.get(file.parent, noassets)
+
+            if do_copyfile:
+                # Sourcefile itself
+                content.file = file
+
+            if committimes is not None and fpath in committimes:
+                # Stable time of content for templates
+                content["lastcommit"] = self.apply_datetime_formats(self.commit_datetime(committimes[fpath]))
 
             # Merge into return subset
-            self._addmerge(contentid, {lang: headers}, ret_contentsl, f"read_contents file: '{fpath}' lang: {lang}")
+            self._addmerge(content.id, {content.lang: content}, ret_contentsl,
+                           f"read_contents file: '{fpath}' lang: {content.lang}")
+            read += 1
 
-        garbage.append(ret_contentsl)
-        return ret_contentsl, garbage
+        self.log.summary(f"Contents of repo {authorrepo.repoid}", read=read, skipped=mdfiles - read)
+
+        return ret_contentsl
+
+    def reload_content(self, content: Content, file: Path) -> bool:
+        "Read headers and body of content again from its md file. Links, tags and files stay as they are."
+        from libs.fileparser import parse_md_file
+
+        headers, body = parse_md_file(file)
+        if not self.check_contentmeta(headers) or not self.replace_headers_basic_inplace(headers):
+            self.log.warn(f"Changed content {file} is not valid anymore. Keeping previous version.")
+            return False
+
+        if "content" not in headers and content.bodysource is None:
+            headers["content"] = body.strip()
+
+        content.meta = headers
+        return True
 
     def apply_datetime_formats(self, dt: datetime) -> Dict[str, str]:
         dtf = self.config.DATETIME_FORMATS.copy()
         dtf.update(self.pageconfig.DATETIME_FORMATS)
         return {code: dt.strftime(dtstr) for code, dtstr in dtf.items()}
 
-    def create_global_page_struct(self, raw_repos: dict) -> Tuple[dict, list]:
-        # Collect all lists and dicts containing references to other objects
-        garbage = list()
-
+    def create_global_page_struct(self, raw_repos: dict) -> dict:
         # Global variables
         if "GLOBAL_STRINGS" in self.pageconfig.CONTENT_SETTINGS:
             ret_merged = self.pageconfig.CONTENT_SETTINGS["GLOBAL_STRINGS"].copy()
@@ -408,27 +571,27 @@ class PageContent:
 
         # ### Collect these global variables:
         # 1.
-        global_authors = _getcreate_subdict(ret_merged, "authors", garbage)  # {nickname: author}
+        global_authors = _getcreate_subdict(ret_merged, "authors")  # {nickname: author}
 
         # 1.a: author["contents"]
 
         # 2.
-        global_contentsl = _getcreate_subdict(ret_merged, "contents", garbage)  # {contentid: {lang: [contents]} }
+        global_contentsl = _getcreate_subdict(ret_merged, "contents")  # {contentid: {lang: [contents]} }
 
         # 3.
-        global_tagsl = _getcreate_subdict(ret_merged, "tags", garbage)  # {tagname: {contentid: {lang: [contents]} } }
+        global_tagsl = _getcreate_subdict(ret_merged, "tags")  # {tagname: {contentid: {lang: [contents]} } }
 
         # 4.
         # Structure not perfect but uniform
-        global_langsl = _getcreate_subdict(ret_merged, "langs", garbage)  # {lang: {contentid: {lang: [contents]} } }
+        global_langsl = _getcreate_subdict(ret_merged, "langs")  # {lang: {contentid: {lang: [contents]} } }
 
         # 5.
-        ret_merged["generationtime"] = self.apply_datetime_formats(datetime.datetime.now())
+        ret_merged["generationtime"] = self.apply_datetime_formats(self.buildtime or datetime.datetime.now())
 
         # Iterate through all repos
         for repoid, raw_repo in raw_repos.items():  # type: str, dict
             # Process author and contents of one repo
-            raw_author, raw_contentsl, raw_gitsource = raw_repo  # type: dict, dict, str
+            raw_author, raw_contentsl, raw_gitsource = raw_repo  # type: Author, dict, str
 
             # ### Nickname/author related ###
             #
@@ -438,21 +601,19 @@ class PageContent:
             # Check already having author by nickname (1.)
             if author_nickname in global_authors:
                 # Another repo of same author. No problem!
-                author: dict = global_authors[author_nickname]
-                gitsources: set = author["gitsources"]
+                author: Author = global_authors[author_nickname]
                 # TODO: check for varying meta tags in raw_author
             else:
                 # First author occurrence. Take raw meta.
                 author = global_authors[author_nickname] = raw_author
-                gitsources = author["gitsources"] = set()
 
             # Collect gitsource
-            gitsources.add(raw_gitsource)
+            author.gitsources.add(raw_gitsource)
 
             # ### Content related ###
             #
             # Check contents list of author (1.a)
-            author_contentsl = _getcreate_subdict(author, "contents", garbage)
+            author_contentsl = author.contents
 
             # Iterate raw repo contents of author and merge globally
             for contentid, raw_contentl in raw_contentsl.items():  # type: str, dict
@@ -465,42 +626,42 @@ class PageContent:
                 self._addmerge(contentid, raw_contentl, global_contentsl, "contents")
 
                 # Different languages may have different or localized tags
-                for lang, raw_content in raw_contentl.items():  # type: str, dict
+                for lang, raw_content in raw_contentl.items():  # type: str, Content
                     contentl = {lang: raw_content}
 
                     # Link author
-                    raw_content["author"] = author
+                    raw_content.author = author
 
                     # (3.)
-                    tags: set = raw_content["tags"]
+                    tags: list = raw_content["tags"]
                     for tag in tags:  # type: str
-                        tagl = _getcreate_subdict(global_tagsl, tag, garbage)
+                        tagl = _getcreate_subdict(global_tagsl, tag)
                         self._addmerge(contentid, contentl, tagl, f"tags[{tag}]")
 
                     # (4.)
-                    langl = _getcreate_subdict(global_langsl, lang, garbage)
+                    langl = _getcreate_subdict(global_langsl, lang)
                     self._addmerge(contentid, contentl, langl, f"langs[{lang}]")
 
+        # Same order in every run
+        for author in global_authors.values():  # type: Author
+            author.gitsources = sorted(author.gitsources)
 
-        return ret_merged, garbage
+        return ret_merged
 
-    def link_contents(self, namespace: dict) -> list:
+    def link_contents(self, namespace: dict):
         """
         Modify content headers:
             linkto -> links
             linkwith -> links
-            langs
-            otherlangs
+            langs (otherlangs derive from it)
         """
 
-        # Collect all lists and dicts containing references to other objects
-        garbage = list()
         contentsl: dict = namespace["contents"]
 
         deflang = self.pageconfig.CONTENT_SETTINGS["LANG_DEFAULT"]
         uselinking = self.pageconfig.FEATURES.get("content:linking", True)
 
-        def get_linked_content(headerkey: str, c: dict) -> Union[dict, None]:
+        def get_linked_content(headerkey: str, c: Content) -> Union[Content, None]:
             if headerkey not in c:
                 # Header not present
                 return None
@@ -544,256 +705,637 @@ class PageContent:
                 return None
 
         for contentid, contentl in contentsl.items():  # type: str, dict
-            for lang, content in contentl.items():  # type: str, dict
+            for lang, content in contentl.items():  # type: str, Content
                 if uselinking:
                     # Linkto
                     linkcontent = get_linked_content("linkto", content)
                     if linkcontent is not None:
-                        content["links"].add(linkcontent)
+                        content.add_link(linkcontent)
 
                     # Linkwith
                     linkcontent = get_linked_content("linkwith", content)
                     if linkcontent is not None:
-                        content["links"].add(linkcontent)
-                        linkcontent["links"].add(content)
+                        content.add_link(linkcontent)
+                        linkcontent.add_link(content)
 
                 # langs
-                content["langs"] = contentl
+                content.langs = contentl
 
-                # otherlangs
-                otherlangs = content["otherlangs"] = {lang: c for lang, c in contentl.items() if c is not content}
-                if len(otherlangs):
-                    garbage.append(otherlangs)
-
-        return garbage
+    def resolve_locations(self, namespace: dict) -> dict:
+        """
+        Assign url and output file to all contents before anything is rendered, so every page can link to any other.
+        Returns {output file: content}. Of colliding contents the last one keeps the file.
+        The others get no url and output, so they are neither written nor linked.
+        Copied files colliding with a page or with another file of the same name are not copied.
+        """
+        outputs = dict()
+        for contentid, contentl in namespace["contents"].items():  # type: str, dict
+            for lang, content in contentl.items():
+                _, relfile, url = content_location(self.pageconfig.CONTENT_SETTINGS, contentid, lang)
+
+                other = outputs.get(relfile)
+                if other is not None:
+                    self.log.err(f"File collision at '{relfile}' of {other!r} and {content!r}. "
+                                 f"Only {content!r} will be written.")
+                    other.url = other.output = None
+
+                content.url = url
+                content.output = relfile
+                outputs[relfile] = content
+
+        self._check_file_collisions(namespace, outputs)
+        return outputs
+
+    def _check_file_collisions(self, namespace: dict, outputs: dict):
+        "Drop pages inside of template folders and copied files which would overwrite a page or another file"
+        do_copyfiles = self.pageconfig.FEATURES.get("files:copy:other", True)
+        do_copyfile = self.pageconfig.FEATURES.get("files:copy:md", False)
+        templatefolders = set(self.pageconfig.GIT_SOURCES.get("TEMPLATES", dict()))
+
+        for relfile in [relfile for relfile in outputs if relfile.parts[0] in templatefolders]:
+            content = outputs.pop(relfile)
+            self.log.err(f"Page '{relfile}' of {content!r} is inside of template folder '{relfile.parts[0]}'. "
+                         f"Not written.")
+            content.url = content.output = None
+
+        copied = dict()  # file relative to webroot -> source file
+        for contentl in namespace["contents"].values():
+            for content in contentl.values():
+                if content.output is None:
+                    continue
 
-    def write_global_page_struct(self, namespace_struct, webroot: PathC, templates: dict) -> dict:
-        deflang = self.pageconfig.CONTENT_SETTINGS.get("LANG_DEFAULT", "en")
+                sources = set()
+                if do_copyfiles and content.files:
+                    sources.update(content.files)
+                if do_copyfile and content.file is not None:
+                    sources.add(content.file)
+
+                dropped = set()
+                for source in sources:  # type: PathC
+                    relfile = content.output.parent / source.name
+                    if relfile in outputs:
+                        self.log.err(f"File '{source}' of {content!r} collides with page of {outputs[relfile]!r}. "
+                                     f"Not copied.")
+                        dropped.add(source)
+                    elif copied.setdefault(relfile, source) != source:
+                        self.log.err(f"File '{source}' of {content!r} collides with '{copied[relfile]}' at "
+                                     f"'{relfile}'. Not copied.")
+                        dropped.add(source)
+
+                if dropped:
+                    if content.files:
+                        content.files = content.files.difference(dropped)
+                    if content.file in dropped:
+                        content.file = None
+
+    def write_global_page_struct(self, namespace_struct, webroot: PathC, templates: dict,
+                                 shard: Tuple[int, int] = None, selection: set = None, outputs: dict = None) -> dict:
+        """
+        Writes all pages and their files.
+        With shard only the outputs of that shard are written, with selection only those of the selected contents.
+        outputs: Result of resolve_locations(). Resolved here if missing.
+        """
         index_only = self.pageconfig.CONTENT_SETTINGS.get("INDEX_ONLY", False)
-        index_file = self.pageconfig.CONTENT_SETTINGS.get("INDEX_FILE", "index.html")
-        file_extension = self.pageconfig.CONTENT_SETTINGS.get("CONTENT_FILE_EXTENSION", ".html")
         default_template = self.pageconfig.CONTENT_SETTINGS.get("TEMPLATE_DEFAULT", None)
-        spreplchar = self.pageconfig.CONTENT_SETTINGS.get("SPACE_REPLACE", "-")
 
         useauthors = self.pageconfig.FEATURES.get("content:authors", True)
         uselinking = self.pageconfig.FEATURES.get("content:linking", True)
         do_copyfiles = self.pageconfig.FEATURES.get("files:copy:other", True)
         do_copyfile = self.pageconfig.FEATURES.get("files:copy:md", False)
         use_tags = self.pageconfig.FEATURES.get("content:tags", True)
+        hardlink = self.pageconfig.FEATURES.get("files:hardlink", True)
 
         # Track all touched files
         touched_files = dict()
 
-        def get_folder_file_url(cid: str, clang: str):
-            "Determine folder, create it if needed, propose filename and url"
-
-            if type(spreplchar) is str:
-                cid_for_urlquote = cid.replace(" ", spreplchar)
-            else:
-                cid_for_urlquote = cid
-
-            if index_only:
-                # python/learn/index.html
-                # python/learn/en/index.html
-                if not clang or clang == deflang:
-                    rfolder = webroot / cid
-                    rurl = parse.quote(f"/{cid_for_urlquote}")
-                else:
-                    rfolder = webroot / cid / clang
-                    rurl = parse.quote(f"/{cid_for_urlquote}/{clang}")
-                rfile = rfolder / index_file
-
-            else:
-                # python/learn.html
-                # python/learn-en.html
-                vfolder = webroot / cid
-                rfolder = vfolder.parent
-                fname = vfolder.name
-
-                if not clang or clang == deflang:
-                    rfile = rfolder / f"{fname}{file_extension}"
-                    rurl = parse.quote(f"/{cid_for_urlquote}{file_extension}")
-                else:
-                    rfile = rfolder / f"{fname}-{clang}{file_extension}"
-                    rurl = parse.quote(f"/{cid_for_urlquote}-{clang}{file_extension}")
-
-            if not clang:
-                # No changes, just an informational request
-                return rfolder, rfile, parse.quote(cid)
+        if outputs is None:
+            outputs = self.resolve_locations(namespace_struct)
 
-            rfolder.mkdir(parents=True, exist_ok=True)
-
-            relfile = rfile.relative_to(webroot)
-            fileid = str(relfile)
-            if fileid in touched_files:
-                self.log.err(f"File collision at '{fileid}'. Content will be overwritten.")
-            else:
-                touched_files[fileid] = rfile
-
-            return rfolder, rfile, rurl
+        copied = 0
 
         def copy_flat(sourcefiles: set, destfolder: PathC):
             "Copies sourcefiles directly into destfolder (without creating any folders)"
+            nonlocal copied
             for cfile in sourcefiles:  # type: PathC
-                newdest = cfile.copy(destfolder)
+                newdest = writer.copy(cfile, destfolder)
                 newid = str(newdest.relative_to(webroot))
                 touched_files[newid] = newdest
+                copied += 1
+
+        def copy_linked(langfolders: dict):
+            "Copies each source file once and hardlinks it into its other language folders"
+            nonlocal copied
+            for cfile, folders in langfolders.items():  # type: PathC, list
+                if len(folders) == 1 or not hardlink:
+                    for folder in folders:
+                        copy_flat((cfile,), folder)
+                    continue
+
+                for newdest in writer.copy_linked(cfile, folders):
+                    touched_files[str(newdest.relative_to(webroot))] = newdest
+                copied += 1
 
         # Load html generator
-        generator = ContentGenerator(templates, basemodels, self.log.sublogger("GENERATOR"), default_template)
+        from libs.content import ContentGenerator
+        generator = ContentGenerator(templates, basemodels, self.log.sublogger("GENERATOR"), default_template,
+                                     self.pageconfig.FEATURES.get("files:fingerprint", False))
 
-        # Install files of all templates
-        generator.install_template_files(webroot, touched_files)
+        # Optional minification between render and write
+        minifier = None
+        if self.pageconfig.FEATURES.get("html:minify", False):
+            minifier = HtmlMinifier(self.pageconfig.ROOT / "cache" / "minify", self.log.sublogger("MINIFY"))
 
-        # Write contents
-        contentsl = namespace_struct["contents"]
-        for contentid, contentl in contentsl.items():  # type: str, dict
-            if not index_only:
-                # Files share same folder. Collect all of each language.
-                files_to_copy = set()
+        # Stream rendered pages directly into their files. Minification needs whole pages.
+        streaming = self.pageconfig.FEATURES.get("render:streaming", False) and minifier is None
+
+        def selected(content: Content) -> bool:
+            return selection is None or content in selection
 
-            for lang, content in contentl.items():  # type: str, dict
-                folder, file, url = get_folder_file_url(contentid, lang)
+        def is_mine(content: Content) -> bool:
+            "Page written by this run"
+            return content.output is not None and in_shard(content.id, content.lang, shard) and selected(content) \
+                and outputs[content.output] is content
 
-                # Assign specific url (with language code)
-                content["url"] = url
+        contentsl = namespace_struct["contents"]
 
-                # Generate html
-                html = generator.generate_content(namespace_struct, "content.html", content)
-                file.write_text(html, encoding="UTF-8", errors="xmlcharrefreplace")
+        # Writes and copies run in background while rendering continues
+        writer = OutputWriter(self.log.sublogger("WRITER"), self.pageconfig.FEATURES.get("output:writers", 8))
 
-                # Collect other source files
-                if index_only:
+        pages = 0
+        try:
+            # Whole folder tree at once, parents first
+            for relfolder in sorted({content.output.parent for contentl in contentsl.values()
+                                     for content in contentl.values() if is_mine(content)}):
+                writer.makedirs(webroot / relfolder)
+
+            # Install files of all templates
+            if is_global_shard(shard) and selection is None:
+                generator.install_template_files(webroot, touched_files)
+
+            # Write contents
+            for contentid, contentl in contentsl.items():  # type: str, dict
+                if not index_only:
+                    # Files share same folder. Collect all of each language.
                     files_to_copy = set()
-
-                if do_copyfiles:
-                    files_to_copy.update(content["files"])
-                if do_copyfile:
-                    files_to_copy.add(content["file"])
+                else:
+                    # Same files in several language folders. Source file -> folders.
+                    langfolders = dict()
+
+                for lang, content in contentl.items():  # type: str, dict
+                    if content.output is None:
+                        # Lost a file collision
+                        continue
+
+                    folder = webroot / content.output.parent
+                    file = webroot / content.output
+
+                    if not is_mine(content):
+                        if not index_only:
+                            # Common folder may belong to this shard
+                            if do_copyfiles:
+                                files_to_copy.update(content["files"])
+                            if do_copyfile and content["file"] is not None:
+                                files_to_copy.add(content["file"])
+                        continue
+
+                    touched_files[str(content.output)] = file
+
+                    # Generate html
+                    content.load_body()
+                    if streaming:
+                        with ReplaceIfChanged(file, errors="xmlcharrefreplace") as stream:
+                            generator.stream_content(namespace_struct, "content.html", content, stream)
+                    else:
+                        html = generator.generate_content(namespace_struct, "content.html", content)
+                        if minifier is not None:
+                            html = minifier.minify(html)
+                        writer.write_text(file, html)
+                    content.release_body()
+                    pages += 1
+
+                    # Collect other source files
+                    if index_only:
+                        files_to_copy = set()
+
+                    if do_copyfiles:
+                        files_to_copy.update(content["files"])
+                    if do_copyfile and content["file"] is not None:
+                        files_to_copy.add(content["file"])
+
+                    if index_only:
+                        # Own folder per language
+                        for cfile in files_to_copy:
+                            langfolders.setdefault(cfile, list()).append(folder)
+
+                if not index_only and files_to_copy and in_shard(contentid, "", shard) \
+                        and any(selected(content) for content in contentl.values()):
+                    relfolder, _, _ = content_location(self.pageconfig.CONTENT_SETTINGS, contentid, "")
+                    writer.makedirs(webroot / relfolder)
+                    copy_flat(files_to_copy, webroot / relfolder)
 
                 if index_only:
-                    # Copy to own folder (duplicates possible)
-                    copy_flat(files_to_copy, folder)
-
-            if not index_only and files_to_copy:
-                commonfolder, _, _ = get_folder_file_url(contentid, "")
-                copy_flat(files_to_copy, commonfolder)
-
+                    copy_linked(langfolders)
+        finally:
+            # Also on errors. Files failed to write must not count as written.
+            writer.close()
+            for path, _ in writer.errors:
+                touched_files.pop(str(path.relative_to(webroot)), None)
+
+        if minifier is not None:
+            if shard is None and selection is None:
+                # Other shards use the cache at the same time. Partial builds don't know all pages.
+                minifier.prune()
+            minifier.report()
+
+        self.log.summary("Write", pages=pages, copied_files=copied)
         return touched_files
 
     def delete_files(self, itemlist: dict):
         "Determine old files or folders not used anymore and delete them"
 
         log = self.log.sublogger("DELETEOLD")
+        deleted_files = deleted_folders = 0
 
         def rm_dir(folder: PathC):
-            log.out(f"Folder: {folder}")
+            nonlocal deleted_files, deleted_folders
+            log.debug("Folder: %s", folder)
             for element in folder.iterdir():
                 if element.is_dir():
                     rm_dir(element)
                 if element.is_file():
-                    log.out(f"File: {element}")
+                    log.debug("File: %s", element)
                     element.unlink(missing_ok=True)
+                    deleted_files += 1
             folder.rmdir()
+            deleted_folders += 1
 
         for orphan in itemlist.values():  # type: PathC
             if orphan.is_file():
-                log.out(f"File: {orphan}")
+                log.debug("File: %s", orphan)
                 orphan.unlink(missing_ok=True)
+                deleted_files += 1
             if orphan.is_dir():
                 rm_dir(orphan)
 
-    def generate(self, repos: dict, onlywhenchanged: bool = False):
+        log.summary("Orphans deleted", files=deleted_files, folders=deleted_folders)
+
+    def finish_output(self, webroot: PathC, files_before: dict, touched_files: dict, namespace: dict = None,
+                      pages: dict = None):
+        """
+        Last stages of a complete build: link check, precompression, orphan deletion, changed urls and file index
+        pages: Result of page_infos(), if there is no namespace
+        """
+        if pages is None:
+            pages = self.page_infos(namespace)
+
+        # Internal links of all pages must resolve to files of this build or static folders
+        if self.pageconfig.FEATURES.get("check:links", False):
+            from libs.linkcheck import LinkChecker
+            LinkChecker(webroot, self.pageconfig.BASEADDRESS, self.pageconfig.WEBROOT_STATIC_DIRS,
+                        self.pageconfig.CONTENT_SETTINGS.get("INDEX_FILE", "index.html"),
+                        self.pageconfig.ROOT / "linkcheck.json", self.log.sublogger("LINKCHECK")).check(touched_files,
+                                                                                                       pages)
+
+        # Compressed siblings of all written text files. Needs to be the last stage writing files.
+        if self.pageconfig.FEATURES.get("files:precompress", False):
+            from libs.precompress import Precompressor
+            Precompressor(webroot, self.pageconfig.ROOT / "precompress.json",
+                          self.log.sublogger("PRECOMPRESS")).update(touched_files)
+
+        touched_folders = get_folders_of_files(touched_files)
+
+        touched_filesfolders = dict()
+        touched_filesfolders.update(touched_files)
+        touched_filesfolders.update(touched_folders)
+
+        # Delete old files
+        delete_files = get_orphan_files(files_before, touched_filesfolders)
+        self.delete_files(delete_files)
+
+        # Added, modified and deleted URLs for cache invalidation
+        self.report_changes(touched_files, pages)
+
+        # Create file index?
+        fileindex = self.pageconfig.FEATURES.get("generate:fileindex", None)
+        if isinstance(fileindex, Path):
+            if not fileindex.is_absolute():
+                fileindex = PathC(self.pageconfig.ROOT / fileindex)
+
+            with open(str(fileindex), "w") as fi:
+                fi.write("File index of generation")
+
+                fi.write("\n\nTouched:\n")
+                for file in touched_filesfolders:
+                    fi.write(f"  {file}\n")
+
+                fi.write("\n\nDeleted files:\n")
+                for file in delete_files:
+                    fi.write(f"  {file}\n")
+
+    def report_changes(self, touched_files: dict, pages: dict, partial: bool = False):
+        "Hand added, modified and deleted URLs to the hook of feature generate:changes"
+        changes = self.pageconfig.FEATURES.get("generate:changes", None)
+        if changes is None:
+            return
+
+        from libs.changes import ChangeManifest, run_hook
+        log = self.log.sublogger("CHANGES")
+        pageurls = {fileid: info["url"] for fileid, info in pages.items()}
+        manifest = ChangeManifest(self.pageconfig.BASEADDRESS, self.pageconfig.ROOT / "changestate.json",
+                                  log).collect(touched_files, pageurls, partial)
+        run_hook(changes, manifest, self.pageconfig.ROOT, log)
+
+    def page_infos(self, namespace: dict = None) -> dict:
+        """
+        {page file relative to webroot: {"url", "id", "lang", "author"}} of all resolved contents.
+        Empty without namespace. Plain data, so shards can pass it on in their manifests.
+        """
+        pages = dict()
+        for contentl in (namespace or dict()).get("contents", dict()).values():
+            for content in contentl.values():
+                if content.output is not None:
+                    author = content.author
+                    pages[str(content.output)] = {"url": content.url, "id": content.id, "lang": content.lang,
+                                                  "author": None if author is None else author.get("nickname")}
+        return pages
+
+    def get_webroot(self, outputdir: Path = None) -> DirFiles:
+        if outputdir is not None:
+            outputdir.mkdir(parents=True, exist_ok=True)
+            return DirFiles(outputdir)
+
+        writedir = self.pageconfig.WEBROOT
+        if not writedir.is_dir():
+            self.log.err(f"Destination folder configured in pageconfig.WEBROOT as '{writedir}'"
+                         f" is missing. Create it with correct permissions first.")
+            raise FileNotFoundError("Folder WEBROOT not existing.")
+
+        return DirFiles(writedir)
+
+    def save_state(self, repos: dict, state: PageState):
+        "Store each repo HEAD as last processed state."
+        for kind, repodict in repos.items():
+            for repoid, repo in repodict.items():
+                state.set(state.key(kind, repoid), repo.head)
+        state.save()
+
+    def build_namespace(self, authorrepos: dict) -> dict:
+        "Read, merge and link all contents of authorrepos"
+        self.next_publish = None
+
+        # Read all authors and their contents.
+        raw_author_and_contents_struct = self.read_authors_with_contents(authorrepos)
+
+        # Merge all authors and contents into a single global namespace
+        global_page_struct = self.create_global_page_struct(raw_author_and_contents_struct)
+
+        # Link contents
+        self.link_contents(global_page_struct)
+
+        # Related contents by shared tags
+        relatedcount = self.pageconfig.FEATURES.get("content:related", 0)
+        if relatedcount:
+            from libs.related import compute_related
+            compute_related(global_page_struct, relatedcount, self.log.sublogger("RELATED"))
+
+        # Responsive image derivatives, copied along with the content files
+        imagesettings = self.pageconfig.FEATURES.get("files:images", None)
+        if imagesettings and self.pageconfig.FEATURES.get("files:copy:other", True):
+            from libs.images import ImageDerivatives
+            ImageDerivatives(self.pageconfig.ROOT / "cache" / "images", imagesettings,
+                             self.log.sublogger("IMAGES")).process(global_page_struct)
+
+        return global_page_struct
+
+    def namespace_settings(self) -> dict:
+        "Settings used to build the namespace"
+        return {
+            "pageid": self.pageconfig.PAGEID,
+            "content": self.pageconfig.CONTENT_SETTINGS,
+            "features": {key: value for key, value in self.pageconfig.FEATURES.items()
+                         if key.startswith(NAMESPACE_FEATURES)},
+            "datetime": [self.config.DATETIME_FORMATS, self.pageconfig.DATETIME_FORMATS],
+        }
+
+    def snapshot_key(self, authorrepos: dict) -> Union[str, None]:
+        "Key of the namespace: author HEADs and the settings used to build it"
+        from libs.snapshot import snapshot_key
+        return snapshot_key({repoid: repo.head for repoid, repo in authorrepos.items()}, self.namespace_settings())
+
+    def open_content_index(self, namespace: dict, authorrepos: dict):
+        """
+        Update the SQLite content index and offer it to templates as namespace['index']. Returns the ContentDB.
+        Needs resolved locations. Contents of author repos at an unchanged HEAD are compared cheaply.
+        """
+        from libs.contentdb import ContentDB, ContentIndex
+        from libs.snapshot import snapshot_key
+
+        contentdb = ContentDB(self.pageconfig.ROOT / CONTENTDB_FILE, self.log.sublogger("CONTENTDB"))
+        contentdb.update(namespace, {repo.origin: repo.head for repo in authorrepos.values()},
+                         snapshot_key(dict(), self.namespace_settings()))
+        namespace["index"] = ContentIndex(contentdb, namespace["contents"])
+        return contentdb
+
+    def get_buildtime(self, repos: dict) -> Union[datetime.datetime, None]:
+        "Deterministic output: Time of the latest commit of all repos instead of now"
+        if not self.pageconfig.FEATURES.get("output:deterministic", False):
+            return None
+
+        latest = max((repo.commit_times.get("", 0) for repodict in repos.values() for repo in repodict.values()),
+                     default=0)
+        return self.commit_datetime(latest) if latest else None
+
+    def commit_datetime(self, timestamp: float) -> datetime.datetime:
+        "Commit time in timezone of feature output:timezone, UTC by default. Independent of the TZ of the build host."
+        tz = self.pageconfig.FEATURES.get("output:timezone") or datetime.timezone.utc
+        return datetime.datetime.fromtimestamp(timestamp, tz)
+
+    def next_publish_datetime(self) -> Union[datetime.datetime, None]:
+        publish = self.next_publish
+        if publish is not None and type(publish) is datetime.date:
+            publish = datetime.datetime.combine(publish, datetime.time())
+        return publish
+
+    def generate(self, repos: dict, onlywhenchanged: bool = False, shard: Tuple[int, int] = None,
+                 outputdir: Path = None, selectors: dict = None):
         """
         Generate all content from authors and templates
         :param repos:
             dict["AUTHORS"/"TEMPLATES"] -> dict[repoid] -> RepoDir
         :param onlywhenchanged:
             Exit if no repos pulls have changed.
+        :param shard:
+            (i, n): Write only outputs of shard i of n and a manifest. Complete the build by merge_shards(n).
+        :param outputdir:
+            Write into outputdir instead of pageconfig.WEBROOT.
+        :param selectors:
+            Partial build: {"contentids", "authors", "tags", "langs": values} of select_contents().
+            Only selected contents and their dependents are written. Nothing else is touched or deleted.
         :return:
         """
-        garbage = list()
+        state = PageState(self.pageconfig.ROOT / STATE_FILE)
 
         try:
             if onlywhenchanged:
-                if not self.need_regenerate([repo for repodict in repos.values() for repo in repodict.values()]):
+                if not self.need_regenerate(repos, state):
                     self.log.out("No changed repositories found. No regeneration needed. Content should be up to date.")
                     return
 
-            # Read all authors and their contents.
-            raw_author_and_contents_struct, authorcontentgarbage = self.read_authors_with_contents(repos["AUTHORS"])
-            garbage.extend(authorcontentgarbage)
-
-            # Merge all authors and contents into a single global namespace
-            global_page_struct, basegarbage = self.create_global_page_struct(raw_author_and_contents_struct)
-            garbage.extend(basegarbage)
-
-            # Link contents
-            linkgarbage = self.link_contents(global_page_struct)
-            garbage.extend(linkgarbage)
-
-            # Create localized lists
-
-
-            # ### WEBROOT access ###
-            writedir = self.pageconfig.WEBROOT
-            if not writedir.is_dir():
-                self.log.err(f"Destination folder configured in pageconfig.WEBROOT as '{writedir}'"
-                             f" is missing. Create it with correct permissions first.")
-                raise FileNotFoundError("Folder WEBROOT not existing.")
-
-            # Remember old files
-            webroot = DirFiles(writedir)
-            files_before = webroot.to_dict(10, with_folders=True, with_files=True, hidden_files=True, hidden_folders=True)
-
-            # Update files on disk
-            touched_files = self.write_global_page_struct(global_page_struct, webroot.path, repos["TEMPLATES"])
-
-            touched_folders = get_folders_of_files(touched_files)
-
-            touched_filesfolders = dict()
-            touched_filesfolders.update(touched_files)
-            touched_filesfolders.update(touched_folders)
+            self.buildtime = self.get_buildtime(repos)
+
+            with build_gc():
+                # Unchanged authors and settings give the same namespace. Only templates may have changed.
+                snapshot = snapshotkey = None
+                if self.pageconfig.FEATURES.get("cache:snapshot", False):
+                    from libs.snapshot import NamespaceSnapshot
+                    snapshot = NamespaceSnapshot(self.pageconfig.ROOT / "cache" / SNAPSHOT_FILE)
+                    snapshotkey = self.snapshot_key(repos["AUTHORS"])
+
+                global_page_struct = None if snapshot is None else snapshot.load(snapshotkey)
+                if global_page_struct is not None:
+                    self.log.out("Authors unchanged. Namespace loaded from snapshot.")
+                    global_page_struct["generationtime"] = self.apply_datetime_formats(
+                        self.buildtime or datetime.datetime.now())
+                else:
+                    global_page_struct = self.build_namespace(repos["AUTHORS"])
+                    if snapshotkey is not None:
+                        snapshot.save(global_page_struct, snapshotkey, self.next_publish_datetime())
+
+                # Partial build
+                selection = None
+                if selectors:
+                    from libs.selection import select_contents
+                    selection = select_contents(global_page_struct, **selectors)
+                    self.log.out(f"Partial build of {len(selection)} selected and dependent contents.")
+
+                # Urls and output files of all contents before any page is rendered
+                outputs = self.resolve_locations(global_page_struct)
+
+                # Create localized lists
+
+
+                # ### WEBROOT access ###
+                webroot = self.get_webroot(outputdir)
+
+                # Remember old files
+                if shard is None and selection is None:
+                    files_before = webroot.to_dict(10, with_folders=True, with_files=True, hidden_files=True,
+                                                   hidden_folders=True)
+
+                # Indexed queries for templates
+                contentdb = None
+                if self.pageconfig.FEATURES.get("index:sqlite", False):
+                    contentdb = self.open_content_index(global_page_struct, repos["AUTHORS"])
+
+                # Update files on disk
+                try:
+                    touched_files = self.write_global_page_struct(global_page_struct, webroot.path,
+                                                                  repos["TEMPLATES"], shard, selection, outputs)
+                finally:
+                    if contentdb is not None:
+                        del global_page_struct["index"]
+                        contentdb.close()
+
+                if is_global_shard(shard) and selection is None:
+                    # Client side search index
+                    searchindex = self.pageconfig.FEATURES.get("generate:searchindex", None)
+                    if isinstance(searchindex, Path):
+                        SearchIndex(webroot.path / searchindex, webroot.path, self.pageconfig.ROOT / "searchindex.json",
+                                    self.log.sublogger("SEARCHINDEX")).update(global_page_struct, touched_files)
+
+                    # Sitemap and Atom feeds
+                    sitemaps = SitemapWriter(webroot.path, self.pageconfig.BASEADDRESS, self.log.sublogger("SITEMAP"))
+                    if self.pageconfig.FEATURES.get("generate:sitemap", False):
+                        sitemaps.write_sitemaps(global_page_struct, touched_files)
+
+                    feedlength = self.pageconfig.FEATURES.get("generate:feeds", 0)
+                    if feedlength:
+                        sitemaps.write_feeds(global_page_struct, touched_files, feedlength)
+
+                #from pprint import pprint
+                #structfile: Path = self.pageconfig.ROOT / "struct.txt"
+                #with open(str(structfile), "w") as sf:
+                #    pprint(global_page_struct, width=200, depth=4, stream=sf)
+
+                if shard is not None:
+                    # Orphans, precompression and state are left to merge_shards()
+                    write_manifest(self.pageconfig.ROOT, shard, webroot.path, touched_files,
+                                   self.page_infos(global_page_struct))
+                    self.log.out(f"Shard {shard[0]}/{shard[1]} done: {len(touched_files)} files.")
+                    return
 
-            #from pprint import pprint
-            #structfile: Path = self.pageconfig.ROOT / "struct.txt"
-            #with open(str(structfile), "w") as sf:
-            #    pprint(global_page_struct, width=200, depth=4, stream=sf)
+                if selection is not None:
+                    # Other files stay as they are. Compressed siblings must not get stale.
+                    if self.pageconfig.FEATURES.get("files:precompress", False):
+                        from libs.precompress import Precompressor
+                        Precompressor(webroot.path, self.pageconfig.ROOT / "precompress.json",
+                                      self.log.sublogger("PRECOMPRESS")).update(touched_files, partial=True)
+                    self.report_changes(touched_files, self.page_infos(global_page_struct), partial=True)
+                    return
 
-            # Delete old files
-            delete_files = get_orphan_files(files_before, touched_filesfolders)
-            self.delete_files(delete_files)
+                self.finish_output(webroot.path, files_before, touched_files, global_page_struct)
 
-            # Create file index?
-            fileindex = self.pageconfig.FEATURES.get("generate:fileindex", None)
-            if isinstance(fileindex, Path):
-                if not fileindex.is_absolute():
-                    fileindex = PathC(self.pageconfig.ROOT / fileindex)
+        except Exception as err:
+            self.log.err(traceback.format_exc())
+            for earg in err.args:
+                self.log.err(earg)
 
-                with open(str(fileindex), "w") as fi:
-                    fi.write("File index of generation")
+            if shard is not None or selectors:
+                return
 
-                    fi.write("\n\nTouched:\n")
-                    for file in touched_filesfolders:
-                        fi.write(f"  {file}\n")
+        self.save_state(repos, state)
 
-                    fi.write("\n\nDeleted files:\n")
-                    for file in delete_files:
-                        fi.write(f"  {file}\n")
+    def merge_shards(self, repos: dict, count: int):
+        """
+        Completes a build of count shards: Copies files of shards written to other output folders into WEBROOT,
+        then deletes orphans once and runs the final stages on all files.
+        """
+        try:
+            manifests = read_manifests(self.pageconfig.ROOT, count)
+            webroot = self.get_webroot()
+            files_before = webroot.to_dict(10, with_folders=True, with_files=True, hidden_files=True,
+                                           hidden_folders=True)
+
+            touched_files = dict()
+            pages = dict()
+            copied = 0
+            writer = OutputWriter(self.log.sublogger("WRITER"), self.pageconfig.FEATURES.get("output:writers", 8))
+            for outputdir, files, shardpages in manifests:  # type: Path, list, dict
+                pages.update(shardpages)
+                samedir = outputdir.resolve() == webroot.path.resolve()
+
+                # Hardlinked files of a shard stay hardlinked: {(inode, name): [relative files]}
+                groups = dict()
+                for relfile in files:  # type: str
+                    touched_files[relfile] = webroot.path / relfile
+                    if not samedir:
+                        source = PathC(outputdir / relfile)
+                        groups.setdefault((source.stat().st_ino, source.name), list()).append(relfile)
+
+                for relfiles in groups.values():
+                    source = PathC(outputdir / relfiles[0])
+                    dests = [webroot.path / relfile for relfile in relfiles]
+                    if all(dest.is_file() and filecmp.cmp(str(source), str(dest), shallow=False) for dest in dests) \
+                            and (len(dests) == 1 or all(dest.samefile(dests[0]) for dest in dests)):
+                        continue
+
+                    if len(dests) == 1:
+                        writer.copy(source, dests[0].parent)
+                    else:
+                        writer.copy_linked(source, [dest.parent for dest in dests])
+                    copied += 1
+
+            if writer.close():
+                raise RuntimeError("Merging shards failed. See errors of writer above.")
+
+            self.log.summary(f"Merged {count} shards", files=len(touched_files), copied=copied)
+            self.finish_output(webroot.path, files_before, touched_files, pages=pages)
+            remove_manifests(self.pageconfig.ROOT, count)
 
         except Exception as err:
             self.log.err(traceback.format_exc())
             for earg in err.args:
                 self.log.err(earg)
+            return
 
-        finally:
-            # ### Finish ###
-            # Now safe destroy garbage contents
-            for element in garbage:
-                element.clear()
-            garbage.clear()
-
-        # Store each repo date as last processed date.
-        for typename, repodict in repos.items():
-            for repoid, repo in repodict.items():
-                repo.store_process_date()
+        self.save_state(repos, PageState(self.pageconfig.ROOT / STATE_FILE))
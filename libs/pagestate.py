@@ -0,0 +1,51 @@
+import datetime
+import json
+from pathlib import Path
+from typing import Union
+
+from libs.filewriting import write_atomic
+
+STATE_VERSION = 1
+
+
+class PageState:
+    """
+    Processing state of all source repos of a page in a single file:
+        {"version": 1, "repos": {"AUTHORS/repoid": {"head": sha, "processed": isodate}}}
+    The file is replaced atomically, so an interrupted run never leaves a half written state.
+    """
+
+    def __init__(self, file: Path):
+        self.file = file
+        self.repos = dict()
+
+        if file.is_file():
+            try:
+                data = json.loads(file.read_text(encoding="UTF-8"))
+                if data.get("version") == STATE_VERSION:
+                    self.repos = data.get("repos", dict())
+            except ValueError:
+                pass
+
+    @staticmethod
+    def key(kind: str, repoid: str) -> str:
+        return f"{kind}/{repoid}"
+
+    def head(self, key: str) -> Union[str, None]:
+        "Last processed HEAD of repo"
+        return self.repos.get(key, dict()).get("head")
+
+    def changed(self, key: str, head: Union[str, None]) -> bool:
+        "Unknown HEADs always count as changed"
+        return head is None or self.head(key) != head
+
+    def set(self, key: str, head: Union[str, None]):
+        if head is None:
+            self.repos.pop(key, None)
+        else:
+            self.repos[key] = {"head": head, "processed": datetime.datetime.now().isoformat(timespec="seconds")}
+
+    def save(self):
+        self.file.parent.mkdir(parents=True, exist_ok=True)
+        data = {"version": STATE_VERSION, "repos": self.repos}
+        write_atomic(self.file, json.dumps(data, indent=1, sort_keys=True).encode("UTF-8"))
@@ -0,0 +1,104 @@
+import gzip
+import hashlib
+import io
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from libs.filecopying import PathC
+from libs.filewriting import write_atomic
+from libs.streamlogging import Logger
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Files worth to compress
+PRECOMPRESS_EXTENSIONS = {".html", ".htm", ".css", ".js", ".svg", ".json", ".xml", ".txt"}
+
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+
+
+def _gzip(data: bytes) -> bytes:
+    # Fixed mtime for identical output of identical input
+    buf = io.BytesIO()
+    with gzip.GzipFile(filename="", mode="wb", compresslevel=GZIP_LEVEL, fileobj=buf, mtime=0) as gz:
+        gz.write(data)
+    return buf.getvalue()
+
+
+def _compress_file(job: tuple) -> tuple:
+    """
+    Worker: Compress a file if its hash differs from oldhash or a sibling is missing.
+    Returns (hash, compressed: bool, list of sibling suffixes)
+    """
+    path, oldhash, use_brotli = job
+    data = Path(path).read_bytes()
+    h = hashlib.sha1(data).hexdigest()
+
+    suffixes = [".gz"]
+    if use_brotli:
+        suffixes.append(".br")
+
+    if h == oldhash and all(os.path.isfile(path + suffix) for suffix in suffixes):
+        return h, False, suffixes
+
+    write_atomic(Path(path + ".gz"), _gzip(data))
+    if use_brotli:
+        write_atomic(Path(path + ".br"), brotli.compress(data, quality=BROTLI_QUALITY))
+
+    return h, True, suffixes
+
+
+class Precompressor:
+    """
+    Writes .gz and .br (if brotli is installed) siblings of static text files for webservers like nginx
+    with gzip_static. Source hashes are remembered, so only changed files get compressed again.
+    """
+
+    def __init__(self, webroot: PathC, statefile: Path, log: Logger, workers: int = None):
+        self.webroot = webroot
+        self.statefile = statefile
+        self.log = log
+        self.workers = workers
+
+    def _load_state(self) -> dict:
+        if self.statefile.is_file():
+            try:
+                return json.loads(self.statefile.read_text(encoding="UTF-8"))
+            except ValueError:
+                self.log.warn(f"Precompress state unreadable. Compressing all files: {self.statefile}")
+        return dict()
+
+    def update(self, touched_files: dict, partial: bool = False):
+        """
+        Compress all eligible touched files and register the siblings in touched_files.
+        partial: touched_files are only a part of the site. State of other files is kept.
+        """
+        if brotli is None:
+            self.log.out("Module brotli (PyPI: brotli) not installed. Writing gzip files only.")
+
+        oldstate = self._load_state()
+        state = dict(oldstate) if partial else dict()
+
+        fileids = sorted(fileid for fileid, file in touched_files.items()
+                         if file.suffix.lower() in PRECOMPRESS_EXTENSIONS)
+        jobs = [(str(touched_files[fileid]), oldstate.get(fileid), brotli is not None) for fileid in fileids]
+
+        compressed = 0
+        if jobs:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                results = pool.map(_compress_file, jobs, chunksize=32)
+
+                for fileid, (h, written, suffixes) in zip(fileids, results):
+                    state[fileid] = h
+                    compressed += written
+                    for suffix in suffixes:
+                        siblingid = fileid + suffix
+                        touched_files[siblingid] = PathC(str(touched_files[fileid]) + suffix)
+
+        write_atomic(self.statefile, json.dumps(state, sort_keys=True).encode("UTF-8"))
+        self.log.out(f"Precompressed {compressed} of {len(jobs)} files. {len(jobs) - compressed} unchanged.")
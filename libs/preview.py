@@ -0,0 +1,148 @@
+import mimetypes
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
+
+from libs.pagecontent import PageContent, basemodels, content_location
+from libs.streamlogging import Logger
+
+
+class PreviewSite:
+    """
+    Renders single contents on request from the local clones.
+    URLs resolve with the same scheme as the written site. Rendered pages are kept in an LRU cache
+    and rendered again when their md file or a file of their template changes.
+    """
+
+    def __init__(self, pagecontent: PageContent, repos: dict, log: Logger, cachesize: int = 64):
+        from libs.content import ContentGenerator, is_html
+
+        self.pagecontent = pagecontent
+        self.settings = pagecontent.pageconfig.CONTENT_SETTINGS
+        self.log = log
+        self.cachesize = cachesize
+        self.cache = OrderedDict()  # content -> (stamp, html)
+        self.lock = threading.Lock()
+
+        self.namespace = pagecontent.build_namespace(repos["AUTHORS"])
+        self.generator = ContentGenerator(repos["TEMPLATES"], basemodels, log.sublogger("GENERATOR"),
+                                          self.settings.get("TEMPLATE_DEFAULT", None))
+
+        origins = {repo.origin: repo for repo in repos["AUTHORS"].values()}
+        self.pages = dict()  # unquoted path -> content
+        self.files = dict()  # unquoted path -> source file
+        self.sources = dict()  # content -> md file
+        self.loaded = dict()  # content -> mtime of md file when read
+
+        pagecontent.resolve_locations(self.namespace)
+        for contentid, contentl in self.namespace["contents"].items():  # type: str, dict
+            for lang, content in contentl.items():
+                if content.output is None:
+                    # Lost a file collision
+                    continue
+
+                # Links of pages and the path of the written file
+                self.pages[unquote(content.url)] = content
+                self.pages["/" + str(content.output)] = content
+                if self.settings.get("INDEX_ONLY", False):
+                    self.pages[unquote(content.url) + "/"] = content
+                    relfolder = content.output.parent
+                else:
+                    relfolder, _, _ = content_location(self.settings, contentid, "")
+                for file in content["files"] or ():  # type: PathC
+                    self.files["/" + str(relfolder / file.name)] = file
+
+                repo = origins.get(content.gitsource)
+                if repo is not None:
+                    source = repo.path / content.mdsource
+                    self.sources[content] = source
+                    self.loaded[content] = source.stat().st_mtime_ns
+
+        for templateid, repo in repos["TEMPLATES"].items():
+            for fpath, file in repo.files.items():  # type: str, PathC
+                if not is_html.match(fpath):
+                    self.files[f"/{templateid}/{fpath}"] = file
+
+        self.log.out(f"Preview of {len(self.sources)} contents and {len(self.files)} files.")
+
+    def _stamp(self, content) -> tuple:
+        "Modification times of the md file and all files of the content's template"
+        source = self.sources.get(content)
+        template = self.generator.get_template(content)
+        return (source.stat().st_mtime_ns if source is not None else 0,
+                max((file.stat().st_mtime_ns for file in template.files.values() if file.is_file()), default=0))
+
+    def render(self, content) -> str:
+        stamp = self._stamp(content)
+
+        with self.lock:
+            cached = self.cache.get(content)
+            if cached is not None and cached[0] == stamp:
+                self.cache.move_to_end(content)
+                return cached[1]
+
+            if content in self.sources and self.loaded[content] != stamp[0]:
+                # md file changed since it was read
+                self.pagecontent.reload_content(content, self.sources[content])
+                self.loaded[content] = stamp[0]
+
+            content.load_body()
+            html = self.generator.generate_content(self.namespace, "content.html", content)
+            content.release_body()
+
+            self.cache[content] = stamp, html
+            self.cache.move_to_end(content)
+            while len(self.cache) > self.cachesize:
+                self.cache.popitem(last=False)
+
+        return html
+
+    def resolve(self, path: str):
+        "(content, None), (None, file) or (None, None)"
+        path = unquote(urlsplit(path).path)
+        if path in self.pages:
+            return self.pages[path], None
+        if path in self.files:
+            return None, self.files[path]
+        return None, None
+
+    def serve(self, host: str = "127.0.0.1", port: int = 8000):
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                content, file = site.resolve(self.path)
+                try:
+                    if content is not None:
+                        body = site.render(content).encode("UTF-8", errors="xmlcharrefreplace")
+                        ctype = "text/html; charset=utf-8"
+                    elif file is not None and file.is_file():
+                        body = file.read_bytes()
+                        ctype = mimetypes.guess_type(file.name)[0] or "application/octet-stream"
+                    else:
+                        self.send_error(404)
+                        return
+                except Exception as e:
+                    site.log.err(f"Preview of {self.path} failed: {type(e).__name__}: {e}")
+                    self.send_error(500, explain=str(e))
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("Cache-Control", "no-store")
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, fmt, *args):
+                site.log.debug(fmt, *args)
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        self.log.out(f"Serving preview on http://{host}:{port}/ (Ctrl+C stops)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,100 @@
+import math
+from libs.streamlogging import Logger
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    from scipy import sparse
+except ImportError:
+    sparse = None
+
+# Upper bound of similarity values held in memory at once (rows * contents)
+BLOCK_CELLS = 1 << 24
+
+
+def _membership(contents: list):
+    """
+    Build the content x tag matrix with idf weighted and row normalized entries.
+    Empty tags and tags of only one content can't relate anything and are left out.
+    """
+    df = dict()
+    for content in contents:
+        for tag in content["tags"]:
+            if tag:
+                df[tag] = df.get(tag, 0) + 1
+
+    columns = {tag: i for i, tag in enumerate(sorted(tag for tag, count in df.items() if count > 1))}
+    n = len(contents)
+
+    rows, cols, values = list(), list(), list()
+    for row, content in enumerate(contents):
+        entries = [(columns[tag], math.log(n / df[tag]) + 1.0) for tag in content["tags"] if tag in columns]
+        if not entries:
+            continue
+
+        norm = math.sqrt(sum(weight * weight for _, weight in entries))
+        for col, weight in entries:
+            rows.append(row)
+            cols.append(col)
+            values.append(weight / norm)
+
+    shape = n, len(columns)
+    if sparse is not None:
+        return sparse.csr_matrix((numpy.array(values, dtype=numpy.float32), (rows, cols)), shape=shape)
+
+    # Dense fallback without scipy
+    m = numpy.zeros(shape, dtype=numpy.float32)
+    m[rows, cols] = values
+    return m
+
+
+def _top_related(m, topk: int):
+    "Yields (row, [(col, score)]) of the topk most similar rows for each row."
+    n = m.shape[0]
+    k = min(topk, n - 1)
+    if k <= 0:
+        return
+
+    mt = m.T
+    blocksize = max(1, BLOCK_CELLS // n)
+
+    for start in range(0, n, blocksize):
+        stop = min(start + blocksize, n)
+        scores = m[start:stop] @ mt
+        if sparse is not None:
+            scores = scores.toarray()
+
+        # Never relate a content to itself
+        scores[numpy.arange(stop - start), numpy.arange(start, stop)] = 0.0
+
+        best = numpy.argpartition(-scores, k - 1, axis=1)[:, :k]
+        bestscores = numpy.take_along_axis(scores, best, axis=1)
+
+        for i in range(stop - start):
+            # Highest score first, lower index on ties for stable results
+            order = numpy.lexsort((best[i], -bestscores[i]))
+            yield start + i, [(int(best[i][j]), float(bestscores[i][j])) for j in order if bestscores[i][j] > 0.0]
+
+
+def compute_related(namespace: dict, topk: int, log: Logger):
+    """
+    Set content.related to the topk contents sharing most (and rarest) tags.
+    Contents are only related within the same language.
+    """
+    if numpy is None:
+        log.warn("Feature content:related needs numpy (PyPI: numpy). Skipped.")
+        return
+
+    for lang, langcontentsl in namespace["langs"].items():  # type: str, dict
+        contents = [contentl[lang] for contentl in langcontentsl.values()]
+        m = _membership(contents)
+        if m.shape[1] == 0:
+            continue
+
+        for row, related in _top_related(m, topk):
+            contents[row].related = [contents[col] for col, _ in related]
+
+        log.out(f"Related contents computed for {len(contents)} contents in language '{lang}'.")
@@ -1,26 +1,44 @@
 from datetime import datetime
 from typing import Union
-from git import Repo
 from libs.filecopying import PathC
 from libs.dirtools import DirFiles
-
-timeformat = '%Y-%m-%d %H:%M:%S'
+from libs.gitrefs import read_head, read_remote_url, commit_times
 
 
 class RepoDir:
     def __init__(self, path: PathC, repoid: str, maxdepth=10):
         self.path = path
-        self.repo: Union[Repo, None] = None
         self.repoid = repoid
         self.maxdepth = maxdepth
-        self.statusfile = PathC(str(path) + ".status")
+        self._repo = None  # git.Repo
         self._files: Union[dict, None] = None
+        self._head: Union[str, None] = None
+        self._origin: Union[str, None] = None
+        self._commit_times: Union[dict, None] = None
         self._dirloader = DirFiles(self.path)
-        self.reload()
 
     def reload(self):
-        self.repo = Repo(self.path)
+        "Forget everything known about the repo, e.g. after a pull"
+        self._repo = None
         self._files = None
+        self._head = None
+        self._origin = None
+        self._commit_times = None
+
+    @property
+    def repo(self):
+        "GitPython repo. Opened on first use only."
+        if self._repo is None:
+            from git import Repo  # GitPython is slow to import
+            self._repo = Repo(self.path)
+        return self._repo
+
+    @property
+    def head(self) -> Union[str, None]:
+        "SHA of checked out commit. Read from .git without GitPython."
+        if self._head is None:
+            self._head = read_head(self.path)
+        return self._head
 
     def get_commit_date(self) -> datetime:
         # 2020-02-16 04:53:32+01:00 <class 'datetime.datetime'>
@@ -29,21 +47,12 @@ class RepoDir:
     def get_commit_summary(self) -> str:
         return self.repo.heads.master.commit.summary
 
-    def get_process_date(self) -> Union[datetime, None]:
-        if self.statusfile.exists():
-            dstr = self.statusfile.read_text()
-            return datetime.strptime(dstr, timeformat)
-        else:
-            return None
-
-    def commit_date_newer(self) -> bool:
-        if self.get_process_date() is None:
-            return True
-
-        return self.get_commit_date() > self.get_process_date()
-
-    def store_process_date(self):
-        self.statusfile.write_text(self.get_commit_date().strftime(timeformat))
+    @property
+    def commit_times(self) -> dict:
+        'Unix time of latest commit of each relative file path. Key "" for HEAD. One git call per run.'
+        if self._commit_times is None:
+            self._commit_times = commit_times(self.path)
+        return self._commit_times
 
     @property
     def files(self) -> dict:
@@ -54,14 +63,10 @@ class RepoDir:
 
     @property
     def origin(self) -> str:
-        if "origin" not in self.repo.remotes:
-            return f"<local repository '{self.path}'>"
-
-        origin = self.repo.remote("origin")
-
-        try:
-            url = next(origin.urls)
-        except StopIteration:
-            url = f"<local repository '{self.path}' without urls>"
+        if self._origin is None:
+            url = read_remote_url(self.path, "origin")
+            if url is None:
+                url = f"<local repository '{self.path}'>"
+            self._origin = url
 
-        return url
+        return self._origin
@@ -0,0 +1,187 @@
+"""
+Client side full text search index.
+
+Layout below the index folder, one subfolder per language:
+    <lang>/index.json   {"prefixlen": 2, "docs": "docs.json", "shards": {prefix: shardfile}}
+    <lang>/docs.json    [[url, title], ...] indexed by document number, null for free numbers
+    <lang>/<shard>.json {term: [docnumber, weight, docnumber, weight, ...]}
+
+A browser loads index.json, tokenizes the query the same way (lowercase word characters),
+and only downloads the shards of the query terms' prefixes.
+"""
+import hashlib
+import json
+import re
+from pathlib import Path
+
+from libs.filecopying import PathC
+from libs.filewriting import write_atomic
+from libs.streamlogging import Logger
+
+STATE_VERSION = 1
+PREFIX_LENGTH = 2
+
+# Term weights by field
+WEIGHTS = (
+    ("title", 4),
+    ("tags", 3),
+    ("description", 2),
+    ("content", 1),
+)
+
+is_word = re.compile(r"\w{2,}")
+is_plain_prefix = re.compile(r"^[a-z0-9]+$")
+md_link_target = re.compile(r"\]\([^)]*\)")
+html_tag = re.compile(r"<[^>]+>")
+
+
+def _json(obj) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), sort_keys=True).encode("UTF-8")
+
+
+def tokenize(text: str) -> list:
+    text = md_link_target.sub("]", text)
+    text = html_tag.sub(" ", text)
+    return is_word.findall(text.lower())
+
+
+def shardname(prefix: str) -> str:
+    "File name of a term prefix. Non ascii prefixes are hex encoded."
+    if is_plain_prefix.match(prefix):
+        return f"{prefix}.json"
+    return f"x{prefix.encode('UTF-8').hex()}.json"
+
+
+def _fieldtext(content, key: str) -> str:
+    value = content.get(key, "")
+    if isinstance(value, (set, list, tuple)):
+        return " ".join(sorted(str(v) for v in value))
+    return "" if value is None else str(value)
+
+
+class SearchIndex:
+    def __init__(self, indexdir: PathC, webroot: PathC, statefile: Path, log: Logger):
+        self.indexdir = indexdir
+        self.webroot = webroot
+        self.statefile = statefile
+        self.log = log
+
+    def _load_state(self) -> dict:
+        if self.statefile.is_file():
+            try:
+                state = json.loads(self.statefile.read_text(encoding="UTF-8"))
+                if state.get("version") == STATE_VERSION:
+                    return state
+            except ValueError:
+                self.log.warn(f"Search index state unreadable. Rebuilding index: {self.statefile}")
+
+        return {"version": STATE_VERSION, "langs": dict()}
+
+    def _register(self, file: PathC, touched_files: dict):
+        touched_files[str(file.relative_to(self.webroot))] = file
+
+    def update(self, namespace: dict, touched_files: dict):
+        "Update the index of all published contents and register its files in touched_files."
+        state = self._load_state()
+        oldlangs: dict = state["langs"]
+        newlangs = state["langs"] = dict()
+
+        for lang, langcontentsl in namespace["langs"].items():  # type: str, dict
+            # Skip hidden contents and losers of file collisions
+            contents = [contentl[lang] for contentl in langcontentsl.values()
+                        if contentl[lang].get("publish") is not NotImplemented and contentl[lang].url is not None]
+            newlangs[lang] = self._update_lang(lang, contents, oldlangs.get(lang, {"docs": dict()}), touched_files)
+
+        write_atomic(self.statefile, _json(state))
+
+    def _update_lang(self, lang: str, contents: list, oldstate: dict, touched_files: dict) -> dict:
+        langdir = self.indexdir / lang
+        langdir.mkdir(parents=True, exist_ok=True)
+
+        olddocs: dict = oldstate["docs"]
+        docs = dict()
+        affected = set()  # prefixes of shards to rebuild
+        docs_changed = False
+
+        # Keep document numbers of known contents, collect free numbers
+        used = {doc["n"] for cid, doc in olddocs.items()}
+        free = sorted(set(range(len(used) + len(contents))).difference(used), reverse=True)
+
+        for content in contents:
+            texts = [(_fieldtext(content, key), weight) for key, weight in WEIGHTS]
+            digest = hashlib.sha1()
+            for text, _ in texts:
+                digest.update(text.encode("UTF-8"))
+                digest.update(b"\0")
+            digest.update(str(content["url"]).encode("UTF-8"))
+            h = digest.hexdigest()
+
+            old = olddocs.pop(content.id, None)
+            if old is not None and old["hash"] == h:
+                # Unchanged content
+                docs[content.id] = old
+                continue
+
+            terms = dict()
+            for text, weight in texts:
+                for term in tokenize(text):
+                    terms[term] = terms.get(term, 0) + weight
+
+            if old is None:
+                number = free.pop()
+            else:
+                number = old["n"]
+                affected.update(term[:PREFIX_LENGTH] for term in old["terms"])
+
+            docs[content.id] = {"n": number, "hash": h, "url": content["url"], "title": _fieldtext(content, "title"),
+                                "terms": terms}
+            affected.update(term[:PREFIX_LENGTH] for term in terms)
+            docs_changed = True
+
+        # Contents not present anymore
+        for old in olddocs.values():
+            affected.update(term[:PREFIX_LENGTH] for term in old["terms"])
+            docs_changed = True
+
+        # All present prefixes. Rebuild missing shards too.
+        prefixes = {term[:PREFIX_LENGTH] for doc in docs.values() for term in doc["terms"]}
+        affected.update(prefix for prefix in prefixes.difference(affected)
+                        if not (langdir / shardname(prefix)).is_file())
+
+        # Collect postings of affected shards
+        postings = dict()  # prefix -> term -> list
+        for doc in docs.values():
+            for term, weight in doc["terms"].items():
+                prefix = term[:PREFIX_LENGTH]
+                if prefix in affected:
+                    postings.setdefault(prefix, dict()).setdefault(term, list()).append((doc["n"], weight))
+
+        written = 0
+        for prefix in sorted(affected.intersection(prefixes)):
+            shard = {term: [v for posting in sorted(plist, key=lambda p: (-p[1], p[0])) for v in posting]
+                     for term, plist in postings[prefix].items()}
+            write_atomic(langdir / shardname(prefix), _json(shard))
+            written += 1
+
+        # Document table and shard directory
+        docsfile = langdir / "docs.json"
+        indexfile = langdir / "index.json"
+        if docs_changed or not docsfile.is_file() or not indexfile.is_file():
+            table = [None] * (max((doc["n"] for doc in docs.values()), default=-1) + 1)
+            for doc in docs.values():
+                table[doc["n"]] = [doc["url"], doc["title"]]
+            write_atomic(docsfile, _json(table))
+            write_atomic(indexfile, _json({
+                "prefixlen": PREFIX_LENGTH,
+                "docs": docsfile.name,
+                "shards": {prefix: shardname(prefix) for prefix in prefixes},
+            }))
+
+        # Register all current index files. Shards of vanished prefixes become orphans.
+        self._register(docsfile, touched_files)
+        self._register(indexfile, touched_files)
+        for prefix in prefixes:
+            self._register(langdir / shardname(prefix), touched_files)
+
+        self.log.out(f"Search index '{lang}': {len(docs)} contents, {len(prefixes)} shards, {written} rewritten.")
+        return {"docs": docs}
@@ -0,0 +1,41 @@
+"""
+Selection of contents for partial builds.
+"""
+
+
+def _matches(value: str, selected: set) -> bool:
+    "Exact id or any content below a folder id"
+    return value in selected or any(value.startswith(s.rstrip("/") + "/") for s in selected)
+
+
+def select_contents(namespace: dict, contentids=(), authors=(), tags=(), langs=()) -> set:
+    """
+    Contents matching the selectors plus their direct dependents.
+    Each kind of selector has to match, one of its values is enough.
+    Dependents are the other languages of a selected content and contents linking to it or listing it as related.
+    """
+    contentids, authors, tags, langs = set(contentids), set(authors), set(tags), set(langs)
+    selected = set()
+
+    for contentl in namespace["contents"].values():
+        for content in contentl.values():
+            if contentids and not _matches(content.id, contentids):
+                continue
+            if authors and (content.author is None or content.author.get("nickname") not in authors):
+                continue
+            if tags and not tags.intersection(content["tags"]):
+                continue
+            if langs and content.lang not in langs:
+                continue
+            selected.add(content)
+
+    dependents = set()
+    for contentl in namespace["contents"].values():
+        for content in contentl.values():
+            if content in selected:
+                dependents.update((content.langs or dict()).values())
+            elif any(other in selected for other in content.links) or \
+                    any(other in selected for other in content.related):
+                dependents.add(content)
+
+    return selected | dependents
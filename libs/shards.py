@@ -0,0 +1,76 @@
+"""
+Splitting of a build across processes or machines.
+Shard i of n renders the outputs whose stable hash of (contentid, lang) falls into it
+and writes a manifest of its files. A merge step combines all manifests.
+"""
+import json
+import zlib
+from pathlib import Path
+from typing import Tuple, Union
+
+from libs.filewriting import write_atomic
+
+MANIFEST_FOLDER = "shards"
+
+
+def parse_shard(arg: str) -> Tuple[int, int]:
+    "Parses 'i/n' with 1 <= i <= n"
+    index, sep, count = arg.partition("/")
+    if not sep or not index.isdigit() or not count.isdigit():
+        raise ValueError(f"Shard must be given as i/n, got '{arg}'.")
+
+    index, count = int(index), int(count)
+    if not 1 <= index <= count:
+        raise ValueError(f"Shard {index} out of range 1..{count}.")
+
+    return index, count
+
+
+def in_shard(contentid: str, lang: str, shard: Union[Tuple[int, int], None]) -> bool:
+    "True if output of contentid in lang belongs to shard. Same result on every machine and run."
+    if shard is None:
+        return True
+
+    index, count = shard
+    return zlib.crc32(f"{contentid}\0{lang}".encode("UTF-8")) % count == index - 1
+
+
+def is_global_shard(shard: Union[Tuple[int, int], None]) -> bool:
+    "Shard writing files not belonging to a content, like template files, sitemaps and search index"
+    return shard is None or shard[0] == 1
+
+
+def manifest_file(root: Path, index: int, count: int) -> Path:
+    return root / MANIFEST_FOLDER / f"{index}-of-{count}.json"
+
+
+def write_manifest(root: Path, shard: Tuple[int, int], outputdir: Path, touched_files: dict, pages: dict = None):
+    """
+    Files written by shard, relative to its outputdir.
+    pages: {page file: {"url", "id", "lang", "author"}} of the contents, as the merge has no namespace.
+    """
+    file = manifest_file(root, *shard)
+    file.parent.mkdir(parents=True, exist_ok=True)
+    data = {"shard": shard[0], "count": shard[1], "output": str(outputdir), "files": sorted(touched_files),
+            "pages": {fileid: info for fileid, info in (pages or dict()).items() if fileid in touched_files}}
+    write_atomic(file, json.dumps(data, indent=0).encode("UTF-8"))
+
+
+def read_manifests(root: Path, count: int) -> list:
+    "[(outputdir, [relative file, ...], pages)] of all shards. Raises FileNotFoundError if a shard is missing."
+    ret = list()
+    for index in range(1, count + 1):
+        file = manifest_file(root, index, count)
+        if not file.is_file():
+            raise FileNotFoundError(f"Manifest of shard {index}/{count} missing: {file}")
+
+        data = json.loads(file.read_text(encoding="UTF-8"))
+        ret.append((Path(data["output"]), data["files"], data.get("pages", dict())))
+
+    return ret
+
+
+def remove_manifests(root: Path, count: int):
+    "Merged manifests must not be merged again by a later run"
+    for index in range(1, count + 1):
+        manifest_file(root, index, count).unlink(missing_ok=True)
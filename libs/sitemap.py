@@ -0,0 +1,202 @@
+import datetime
+import hashlib
+import re
+from xml.sax.saxutils import escape, quoteattr
+
+from libs.filecopying import PathC
+from libs.filewriting import ReplaceIfChanged
+from libs.streamlogging import Logger
+
+# Limit of URLs per sitemap file by sitemaps.org
+SITEMAP_MAX_URLS = 50000
+
+SITEMAP_FILE = "sitemap.xml"
+FEEDS_FOLDER = "feeds"
+
+is_iso_date = re.compile(r"^\d{4}-\d{2}-\d{2}")
+unsafe_filename_chars = re.compile(r"[^\w.-]+")
+
+
+def isodate(value) -> str:
+    "W3C date of a date header or empty string"
+    if isinstance(value, datetime.datetime):
+        return value.date().isoformat()
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    if isinstance(value, str) and is_iso_date.match(value):
+        return value[:10]
+    return ""
+
+
+def tag_filename(tag: str) -> str:
+    "File name of the feed of tag. Tags with unsafe characters get a hash suffix, so 'C++' and 'C#' never collide."
+    safe = unsafe_filename_chars.sub("-", tag)
+    if safe == tag:
+        return safe
+    return f"{safe}-{hashlib.sha1(tag.encode('UTF-8')).hexdigest()[:8]}"
+
+
+def sitemap_bucket(url: str, buckets: int) -> int:
+    "Sitemap shard of url. Stable, so a new URL only changes its own shard."
+    return int(hashlib.sha1(url.encode("UTF-8")).hexdigest()[:8], 16) % buckets
+
+
+def published_contents(contentsl: dict):
+    "Yields all visible contents of a {contentid: {lang: content}} collection"
+    for contentl in contentsl.values():
+        for content in contentl.values():
+            if content.get("publish") is not NotImplemented and content["url"] is not None:
+                yield content
+
+
+class SitemapWriter:
+    """
+    Writes sitemap.xml and Atom feeds per language and per tag.
+    Files are streamed to disk and only replaced if their content changed.
+    """
+
+    def __init__(self, webroot: PathC, baseaddress: str, log: Logger):
+        self.webroot = webroot
+        self.baseaddress = baseaddress.rstrip("/")
+        self.log = log
+        self.written = 0
+        self.unchanged = 0
+
+    def _write(self, file: PathC, touched_files: dict, writer, *args):
+        "Stream writer(f, *args) into file and register it"
+        file.parent.mkdir(parents=True, exist_ok=True)
+
+        replace = ReplaceIfChanged(file)
+        with replace as f:
+            writer(f, *args)
+
+        if replace.changed:
+            self.written += 1
+        else:
+            self.unchanged += 1
+
+        touched_files[str(file.relative_to(self.webroot))] = file
+
+    def absurl(self, url: str) -> str:
+        return self.baseaddress + url
+
+    # ### Sitemap ###
+
+    def write_sitemaps(self, namespace: dict, touched_files: dict):
+        # Entries sorted by location. Same input gives same shards.
+        entries = sorted(((content["url"], isodate(content.get("date")), content)
+                          for content in published_contents(namespace["contents"])), key=lambda e: e[0])
+
+        if len(entries) <= SITEMAP_MAX_URLS:
+            self._write(self.webroot / SITEMAP_FILE, touched_files, self._write_urlset, entries)
+        else:
+            shards = self._shards(entries)
+            shardfiles = list()
+            for number, shard in sorted(shards.items()):
+                shardfile = self.webroot / f"sitemap-{number + 1}.xml"
+                self._write(shardfile, touched_files, self._write_urlset, shard)
+                shardfiles.append((shardfile, max(lastmod for _, lastmod, _ in shard)))
+
+            self._write(self.webroot / SITEMAP_FILE, touched_files, self._write_sitemapindex, shardfiles)
+
+        self.log.out(f"Sitemap with {len(entries)} URLs.")
+
+    @staticmethod
+    def _shards(entries: list) -> dict:
+        """
+        {bucket: entries} by hash of the URL. Buckets are a power of two and half full on average.
+        Their number only changes when the site doubles or halves. Then each bucket splits in two.
+        """
+        buckets = 2
+        while len(entries) > buckets * SITEMAP_MAX_URLS // 2:
+            buckets *= 2
+
+        while True:
+            shards = dict()
+            for entry in entries:
+                shards.setdefault(sitemap_bucket(entry[0], buckets), list()).append(entry)
+            if max(len(shard) for shard in shards.values()) <= SITEMAP_MAX_URLS:
+                return shards
+            buckets *= 2
+
+    def _write_urlset(self, f, entries: list):
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"'
+                ' xmlns:xhtml="http://www.w3.org/1999/xhtml">\n')
+
+        for url, lastmod, content in entries:
+            f.write(f"<url><loc>{escape(self.absurl(url))}</loc>")
+            if lastmod:
+                f.write(f"<lastmod>{lastmod}</lastmod>")
+
+            otherlangs = content.otherlangs
+            if otherlangs:
+                for lang, other in sorted(content.langs.items()):
+                    if other["url"] is not None:
+                        f.write(f'<xhtml:link rel="alternate" hreflang={quoteattr(lang)}'
+                                f' href={quoteattr(self.absurl(other["url"]))}/>')
+            f.write("</url>\n")
+
+        f.write("</urlset>\n")
+
+    def _write_sitemapindex(self, f, shardfiles: list):
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n')
+
+        for shardfile, lastmod in shardfiles:  # type: PathC, str
+            f.write(f"<sitemap><loc>{escape(self.absurl('/' + shardfile.name))}</loc>")
+            if lastmod:
+                f.write(f"<lastmod>{lastmod}</lastmod>")
+            f.write("</sitemap>\n")
+
+        f.write("</sitemapindex>\n")
+
+    # ### Atom feeds ###
+
+    def write_feeds(self, namespace: dict, touched_files: dict, length: int):
+        feedsdir = self.webroot / FEEDS_FOLDER
+
+        for lang, langcontentsl in sorted(namespace["langs"].items()):  # type: str, dict
+            self._write_feed(feedsdir / f"{lang}.atom", touched_files, f"{namespace.get('pagename', '')} ({lang})",
+                             published_contents(langcontentsl), length)
+
+        for tag, tagcontentsl in sorted(namespace["tags"].items()):  # type: str, dict
+            if not tag:
+                continue
+            filename = tag_filename(tag)
+            self._write_feed(feedsdir / "tags" / f"{filename}.atom", touched_files,
+                             f"{namespace.get('pagename', '')}: {tag}", published_contents(tagcontentsl), length)
+
+        self.log.out(f"Feeds written for {len(namespace['langs'])} languages and {len(namespace['tags'])} tags.")
+
+    def _write_feed(self, file: PathC, touched_files: dict, title: str, contents, length: int):
+        # Newest first. Only references are sorted, content stays where it is.
+        latest = sorted(((isodate(c.get("date")), c.id, c.lang, c) for c in contents), reverse=True)[:length]
+        self._write(file, touched_files, self._write_atom, file, title, latest)
+
+    def _write_atom(self, f, file: PathC, title: str, latest: list):
+        feedurl = self.absurl("/" + str(file.relative_to(self.webroot)))
+        updated = max((date for date, _, _, _ in latest), default="1970-01-01")
+
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<feed xmlns="http://www.w3.org/2005/Atom">\n'
+                f"<id>{escape(feedurl)}</id>\n"
+                f"<title>{escape(title)}</title>\n"
+                f"<updated>{updated}T00:00:00Z</updated>\n"
+                f'<link rel="self" href={quoteattr(feedurl)}/>\n'
+                f'<link href={quoteattr(self.absurl("/"))}/>\n')
+
+        for date, _, lang, content in latest:
+            url = self.absurl(content["url"])
+            author = content.author
+            f.write(f"<entry xml:lang={quoteattr(lang)}>"
+                    f"<id>{escape(url)}</id>"
+                    f"<title>{escape(str(content.get('title', '')))}</title>"
+                    f"<link href={quoteattr(url)}/>"
+                    f"<updated>{date or updated}T00:00:00Z</updated>")
+            if author is not None:
+                f.write(f"<author><name>{escape(str(author.get('nickname', '')))}</name></author>")
+            f.write(f"<summary>{escape(str(content.get('description', '')))}</summary>"
+                    "</entry>\n")
+
+        f.write("</feed>\n")
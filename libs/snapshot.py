@@ -0,0 +1,121 @@
+import datetime
+import hashlib
+import io
+import json
+import pickle
+from pathlib import Path
+from typing import Union
+
+from libs.filewriting import write_atomic
+from libs.model import Author, Content, Record
+
+# Increase on any change of namespace or model layout
+SNAPSHOT_VERSION = 2
+
+RECORD_CLASSES = {cls.__name__: cls for cls in (Author, Content)}
+
+
+def _stable(obj):
+    "JSON value of obj the same in every run. Values without one, like callables, are left out as null."
+    if isinstance(obj, (Path, datetime.date, datetime.time)):
+        return str(obj)
+    if isinstance(obj, (set, frozenset)):
+        return sorted(str(value) for value in obj)
+    return None
+
+
+def snapshot_key(authorheads: dict, settings: dict) -> Union[str, None]:
+    "Key of a namespace built from authors at these HEADs with these settings. None if a HEAD is unknown."
+    if any(head is None for head in authorheads.values()):
+        return None
+
+    data = {"version": SNAPSHOT_VERSION, "authors": authorheads, "settings": settings}
+    return hashlib.sha1(json.dumps(data, sort_keys=True, default=_stable).encode("UTF-8")).hexdigest()
+
+
+def _records(namespace: dict) -> list:
+    "All authors and contents of namespace"
+    records = list(namespace["authors"].values())
+    for contentl in namespace["contents"].values():
+        records.extend(contentl.values())
+    return records
+
+
+class _Pickler(pickle.Pickler):
+    # Records are stored once in a flat list and referenced by number.
+    # Pickling the linked graph directly would recurse along every link.
+
+    def __init__(self, file, numbers: dict):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.numbers = numbers
+
+    def persistent_id(self, obj):
+        if isinstance(obj, Record):
+            return self.numbers.get(id(obj))
+        return None
+
+
+class _Unpickler(pickle.Unpickler):
+    def __init__(self, file, records: list):
+        super().__init__(file)
+        self.records = records
+
+    def persistent_load(self, pid):
+        return self.records[pid]
+
+
+class NamespaceSnapshot:
+    """
+    Stores a merged and linked namespace in a single file.
+    A snapshot is only valid for the same key and until its expiry,
+    e.g. the date of the next content waiting for its publish date.
+    """
+
+    def __init__(self, file: Path):
+        self.file = file
+
+    def save(self, namespace: dict, key: str, expires: datetime.datetime = None):
+        records = _records(namespace)
+        numbers = {id(record): number for number, record in enumerate(records)}
+
+        buf = io.BytesIO()
+        header = {
+            "version": SNAPSHOT_VERSION,
+            "key": key,
+            "expires": None if expires is None else expires.isoformat(),
+            "classes": [type(record).__name__ for record in records],
+        }
+        pickle.dump(header, buf, protocol=pickle.HIGHEST_PROTOCOL)
+
+        # Other objects of the states are pickled normally
+        _Pickler(buf, numbers).dump(([record.__getstate__() for record in records], namespace))
+
+        self.file.parent.mkdir(parents=True, exist_ok=True)
+        write_atomic(self.file, buf.getvalue())
+
+    def load(self, key: str) -> Union[dict, None]:
+        "Namespace of snapshot or None if missing, outdated or unreadable"
+        if key is None or not self.file.is_file():
+            return None
+
+        try:
+            with open(str(self.file), "rb") as f:
+                header = pickle.load(f)
+                if header.get("version") != SNAPSHOT_VERSION or header.get("key") != key:
+                    return None
+
+                expires = header.get("expires")
+                if expires is not None and datetime.datetime.now() >= datetime.datetime.fromisoformat(expires):
+                    return None
+
+                # Empty records first. References of the states resolve to them.
+                records = [RECORD_CLASSES[name].__new__(RECORD_CLASSES[name]) for name in header["classes"]]
+                states, namespace = _Unpickler(f, records).load()
+
+        except (OSError, EOFError, KeyError, ValueError, pickle.UnpicklingError, AttributeError, ImportError):
+            return None
+
+        for record, state in zip(records, states):
+            record.__setstate__(state)
+
+        return namespace
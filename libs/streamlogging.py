@@ -1,38 +1,127 @@
+import atexit
 import sys
+import threading
 from typing import TextIO
 
+# Log levels
+DEBUG = 10
+INFO = 20
+WARN = 30
+ERROR = 40
+
+LEVELS = {"debug": DEBUG, "info": INFO, "warn": WARN, "error": ERROR}
+
+
+class _LogState:
+    "State shared by a logger and all of its subloggers"
+
+    def __init__(self, level: int, buffered: bool, maxpending: int = 256):
+        self.level = level
+        self.buffered = buffered
+        self.maxpending = maxpending
+        self.pending = []  # (stream, line)
+        self.lock = threading.Lock()
+        if buffered:
+            # Also on exceptions and sys.exit() without an explicit flush
+            atexit.register(self._flush_at_exit)
+
+    def write(self, stream: TextIO, line: str, urgent: bool = False):
+        with self.lock:
+            if not self.buffered:
+                stream.write(line)
+                return
+
+            self.pending.append((stream, line))
+            if urgent:
+                # Warnings and errors reach the file even if the process dies right after
+                for written in self._flush_pending():
+                    written.flush()
+            elif len(self.pending) >= self.maxpending:
+                self._flush_pending()
+
+    def _flush_pending(self) -> list:
+        "Write pending lines. Returns the streams written to."
+        # Join consecutive lines of the same stream. Order between streams is kept.
+        chunk = []
+        current = None
+        streams = []
+        for stream, line in self.pending:
+            if stream is not current and chunk:
+                current.write("".join(chunk))
+                chunk.clear()
+            if stream not in streams:
+                streams.append(stream)
+            current = stream
+            chunk.append(line)
+
+        if chunk:
+            current.write("".join(chunk))
+        self.pending.clear()
+        return streams
+
+    def flush(self):
+        with self.lock:
+            self._flush_pending()
+
+    def _flush_at_exit(self):
+        try:
+            with self.lock:
+                for stream in self._flush_pending():
+                    stream.flush()
+        except ValueError:
+            pass  # Stream already closed
+
 
 class Logger:
-    def __init__(self, out=sys.stdout, warn=sys.stdout, err=sys.stderr):
+    def __init__(self, out=sys.stdout, warn=sys.stdout, err=sys.stderr, level: int = INFO, buffered: bool = False):
         self._out = out
         self._warn = warn
         self._err = err
         self._subsections = []
+        self._prefix = ""
+        self._state = _LogState(level, buffered)
         self.prefix_warn = "[WARN] " if self._warn is self._out else ""
         self.prefix_err = "### [ERROR] " if self._err is self._out else ""
 
-    def _write(self, stream: TextIO, msg: str, prefix: str = ""):
-        if len(self._subsections):
-            stream.write("[")
-            stream.write(":".join(self._subsections))
-            stream.write("] ")
+    @property
+    def level(self) -> int:
+        return self._state.level
+
+    @level.setter
+    def level(self, level: int):
+        # Affects all subloggers too
+        self._state.level = level
 
-        if prefix:
-            stream.write(prefix)
+    def enabled(self, level: int) -> bool:
+        return level >= self._state.level
 
-        stream.write(str(msg))
-        stream.write("\n")
+    def _write(self, stream: TextIO, msg: str, prefix: str = "", args: tuple = (), urgent: bool = False):
+        if args:
+            msg = msg % args
+        self._state.write(stream, f"{self._prefix}{prefix}{msg}\n", urgent)
 
-    def out(self, msg: str):
-        self._write(self._out, msg)
+    def debug(self, msg: str, *args):
+        "Messages are only formatted if debugging is enabled. Use %-style args for expensive messages."
+        if self._state.level <= DEBUG:
+            self._write(self._out, msg, "", args)
 
-    def warn(self, msg: str):
-        self._write(self._warn, msg, self.prefix_warn)
+    def out(self, msg: str, *args):
+        if self._state.level <= INFO:
+            self._write(self._out, msg, "", args)
 
-    def err(self, msg: str):
-        self._write(self._err, msg, self.prefix_warn)
+    def warn(self, msg: str, *args):
+        if self._state.level <= WARN:
+            self._write(self._warn, msg, self.prefix_warn, args, urgent=True)
+
+    def err(self, msg: str, *args):
+        self._write(self._err, msg, self.prefix_err, args, urgent=True)
+
+    def summary(self, stage: str, **counts):
+        "One line summary of a stage: 'stage: 12 read, 2 skipped.'"
+        self.out(f"{stage}: " + ", ".join(f"{count} {name}" for name, count in counts.items()) + ".")
 
     def flush(self):
+        self._state.flush()
         self._out.flush()
 
         for stream in (self._warn, self._err):
@@ -40,6 +129,86 @@ class Logger:
                 stream.flush()
 
     def sublogger(self, subsectionname: str) -> "Logger":
-        subl = Logger(out=self._out, warn=self._warn, err=self._err)
-        subl._subsections.extend(self._subsections + [subsectionname])
+        subl = Logger.__new__(Logger)
+        subl._out, subl._warn, subl._err = self._out, self._warn, self._err
+        subl._subsections = self._subsections + [subsectionname]
+        subl._prefix = "[" + ":".join(subl._subsections) + "] "
+        subl._state = self._state
+        subl.prefix_warn = self.prefix_warn
+        subl.prefix_err = self.prefix_err
         return subl
+
+    def _emit(self, level: int, subsections: tuple, msg: str):
+        "Write a record received from a QueueLogger"
+        logger = self
+        for name in subsections[len(self._subsections):]:
+            logger = logger.sublogger(name)
+
+        if level >= ERROR:
+            logger.err(msg)
+        elif level >= WARN:
+            logger.warn(msg)
+        elif level >= INFO:
+            logger.out(msg)
+        else:
+            logger.debug(msg)
+
+    def worker_logger(self, queue) -> "QueueLogger":
+        """
+        Logger for worker processes or threads writing into queue.
+        Use a multiprocessing.Manager().Queue() for process pools. Start self.listen(queue) to write the records.
+        """
+        return QueueLogger(queue, tuple(self._subsections), self._state.level)
+
+    def listen(self, queue) -> threading.Thread:
+        "Write records of worker loggers until None is put into queue. Join the returned thread afterwards."
+        def drain():
+            while True:
+                record = queue.get()
+                if record is None:
+                    break
+                self._emit(*record)
+
+        t = threading.Thread(target=drain, name="log-listener", daemon=True)
+        t.start()
+        return t
+
+
+class QueueLogger:
+    """
+    Picklable logger for parallel workers. Whole messages are put into a queue,
+    so lines of different workers never get mixed.
+    """
+
+    def __init__(self, queue, subsections: tuple = (), level: int = INFO):
+        self.queue = queue
+        self.subsections = subsections
+        self.level = level
+
+    def enabled(self, level: int) -> bool:
+        return level >= self.level
+
+    def _put(self, level: int, msg: str, args: tuple):
+        if level >= self.level:
+            self.queue.put((level, self.subsections, msg % args if args else str(msg)))
+
+    def debug(self, msg: str, *args):
+        self._put(DEBUG, msg, args)
+
+    def out(self, msg: str, *args):
+        self._put(INFO, msg, args)
+
+    def warn(self, msg: str, *args):
+        self._put(WARN, msg, args)
+
+    def err(self, msg: str, *args):
+        self._put(ERROR, msg, args)
+
+    def summary(self, stage: str, **counts):
+        self.out(f"{stage}: " + ", ".join(f"{count} {name}" for name, count in counts.items()) + ".")
+
+    def flush(self):
+        pass
+
+    def sublogger(self, subsectionname: str) -> "QueueLogger":
+        return QueueLogger(self.queue, self.subsections + (subsectionname,), self.level)
@@ -0,0 +1,152 @@
+import filecmp
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from libs.filecopying import PathC
+from libs.filewriting import write_atomic
+from libs.streamlogging import Logger
+
+
+def _unchanged(source: Path, dest: Path) -> bool:
+    "dest already holds the bytes of source. Same size and mtime count as same content."
+    try:
+        sst, dst = source.stat(), dest.stat()
+    except OSError:
+        return False
+    if sst.st_size != dst.st_size:
+        return False
+    return sst.st_mtime_ns == dst.st_mtime_ns or filecmp.cmp(str(source), str(dest), shallow=False)
+
+
+class OutputWriter:
+    """
+    Writes files and copies assets in background threads while the caller keeps rendering.
+    At most maxpending jobs are queued. Further submits block until a worker is free,
+    so rendered pages never pile up in memory.
+    Many workers help on network filesystems where each file costs a round trip.
+    workers=0 runs every job immediately in the calling thread.
+    """
+
+    def __init__(self, log: Logger, workers: int = 8, maxpending: int = None):
+        self.log = log
+        self.workers = workers
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="writer") if workers > 0 else None
+        self.slots = threading.BoundedSemaphore(maxpending or max(1, workers) * 4)
+        self.folders = set()  # Folders known to exist
+        self.lock = threading.Lock()
+        self.errors = list()  # (path, error message)
+        self.written = 0
+        self.unchanged = 0
+        self.copied = 0
+        self.linked = 0
+
+    def makedirs(self, folder: Path):
+        "Create folder and its parents. Each folder is created only once per writer."
+        if folder in self.folders:
+            return
+        folder.mkdir(parents=True, exist_ok=True)
+        with self.lock:
+            self.folders.add(folder)
+
+    def _submit(self, paths: list, job, *args):
+        "paths: Files of the job. All of them count as failed if job raises."
+        if self.pool is None:
+            self._run(paths, job, *args)
+            return
+
+        self.slots.acquire()  # Backpressure
+        try:
+            future = self.pool.submit(self._run, paths, job, *args)
+        except BaseException:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda _: self.slots.release())
+
+    def _run(self, paths: list, job, *args):
+        try:
+            job(*args)
+        except Exception as e:
+            with self.lock:
+                self.errors.extend((path, f"{type(e).__name__}: {e}") for path in paths)
+
+    def _write(self, path: Path, data: bytes):
+        self.makedirs(path.parent)
+        try:
+            if path.stat().st_size == len(data) and path.read_bytes() == data:
+                # Keep file and its timestamps
+                with self.lock:
+                    self.unchanged += 1
+                return
+        except OSError:
+            pass
+        # Readers never see a partially written page
+        write_atomic(path, data)
+        with self.lock:
+            self.written += 1
+
+    def _copy(self, source: PathC, dest: PathC):
+        self.makedirs(dest.parent)
+        if _unchanged(source, dest):
+            # Keep file and its timestamps
+            with self.lock:
+                self.unchanged += 1
+            return
+        # Keep mtime of source, so unchanged sources give unchanged outputs
+        shutil.copy2(str(source), str(dest))
+        with self.lock:
+            self.copied += 1
+
+    def _copy_linked(self, source: PathC, dests: list):
+        first = dests[0]
+        self._copy(source, first)
+
+        for dest in dests[1:]:  # type: PathC
+            self.makedirs(dest.parent)
+            try:
+                if not (dest.is_file() and os.path.samefile(str(first), str(dest))):
+                    tmp = dest.with_name(f".{dest.name}.link")
+                    if tmp.exists():
+                        tmp.unlink()
+                    os.link(str(first), str(tmp))
+                    os.replace(str(tmp), str(dest))
+                with self.lock:
+                    self.linked += 1
+            except OSError:
+                # No hardlinks across filesystems or on some network shares
+                self._copy(first, dest)
+
+    def write_bytes(self, path: Path, data: bytes):
+        self._submit([path], self._write, path, data)
+
+    def write_text(self, path: Path, text: str):
+        self.write_bytes(path, text.encode("UTF-8", errors="xmlcharrefreplace"))
+
+    def copy(self, source: PathC, destfolder: PathC) -> PathC:
+        "Copy source into destfolder. Returns the destination path immediately."
+        dest = destfolder / source.name
+        self._submit([dest], self._copy, source, dest)
+        return dest
+
+    def copy_linked(self, source: PathC, destfolders: list) -> list:
+        """
+        Copy source into the first of destfolders and hardlink the copy into the others.
+        Falls back to copies where linking fails. Returns the destination paths immediately.
+        """
+        dests = [destfolder / source.name for destfolder in destfolders]
+        self._submit(dests, self._copy_linked, source, dests)
+        return dests
+
+    def close(self) -> int:
+        "Wait for all pending jobs, report failed files and return their count"
+        if self.pool is not None:
+            self.pool.shutdown(wait=True)
+
+        for path, error in self.errors:
+            self.log.err(f"Writing {path} failed: {error}")
+
+        self.log.summary("Writer", written=self.written, unchanged=self.unchanged, copied=self.copied,
+                         linked=self.linked, failed=len(self.errors))
+        return len(self.errors)
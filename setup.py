@@ -12,6 +12,12 @@ setup(
     packages=[],
 
     install_requires=("Jinja2", "PyYAML", "GitPython", "markdown"),
+    extras_require={
+        "related": ("numpy", "scipy"),  # content:related
+        "images": ("Pillow",),  # files:images
+        "brotli": ("brotli",),  # files:precompress also writes .br files
+        "all": ("numpy", "scipy", "Pillow", "brotli"),
+    },
 
     author="Adrian Sausenthaler",
     author_email="pypi@digi-solution.de",
@@ -2,7 +2,9 @@
 import sys
 from config import Config
 from libs.page import Page
-from libs.streamlogging import Logger
+from libs.shards import parse_shard
+from libs.streamlogging import Logger, DEBUG, WARN
+from pathlib import Path
 
 
 class Updater:
@@ -14,12 +16,32 @@ class Updater:
         self.nogenerate = False
         self.generate_on_changes_only = False
         self.fromcron = False
+        self.shard = None
+        self.outputdir = None
+        self.mergeshards = 0
+        self.serve = False
+        self.selectors = dict()
+        self.port = 8000
 
     def fail(self, text: str):
         "Raise an Exception and quit application"
         self.log.err(text)
         raise Exception(text)
 
+    def option_value(self, args: list, option: str):
+        "Value following option or None"
+        if option not in args:
+            return None
+
+        i = args.index(option)
+        if i + 1 >= len(args):
+            self.fail(f"Option {option} needs a value.")
+        return args[i + 1]
+
+    def option_values(self, args: list, option: str) -> list:
+        "Values of all occurrences of option"
+        return [args[i + 1] for i, arg in enumerate(args[:-1]) if arg == option]
+
     def parse_pages(self, args: list) -> set:
         """
         Parse and check pages with arguments and config.
@@ -65,6 +87,31 @@ class Updater:
 
         --nogenerate
             Do not generate content.
+
+        --verbose
+            Log every processed file.
+
+        --quiet
+            Log warnings and errors only.
+
+        --shard i/n
+            Write only the pages of shard i of n (1 <= i <= n) and a manifest of written files.
+            Orphans are not deleted. Run --merge-shards n after all shards have finished.
+
+        --output folder
+            Write into folder instead of the page's WEBROOT. E.g. one folder per shard.
+
+        --merge-shards n
+            Combine the manifests of n shards into WEBROOT and delete orphans. No generation.
+
+        --content id, --author nickname, --tag tag, --lang code
+            Partial build of matching contents and contents depending on them. Repeatable.
+            Other files in WEBROOT stay untouched, nothing gets deleted.
+            A folder id selects all contents below it.
+
+        --serve [--port port]
+            Preview one page on http://127.0.0.1:port/ (default 8000). Pages are rendered on request
+            from the local clones. Nothing is cloned or written.
         \n""")
 
     def main(self, args: list) -> int:
@@ -88,9 +135,55 @@ class Updater:
         self.fromcron = "--cron" in args
         self.generate_on_changes_only = self.fromcron
 
+        shard = self.option_value(args, "--shard")
+        if shard is not None:
+            try:
+                self.shard = parse_shard(shard)
+            except ValueError as e:
+                self.fail(str(e))
+
+        output = self.option_value(args, "--output")
+        if output is not None:
+            self.outputdir = Path(output).absolute()
+
+        merge = self.option_value(args, "--merge-shards")
+        if merge is not None:
+            if not merge.isdigit() or int(merge) < 1:
+                self.fail("--merge-shards needs the number of shards.")
+            self.mergeshards = int(merge)
+
+        for option, key in (("--content", "contentids"), ("--author", "authors"), ("--tag", "tags"),
+                            ("--lang", "langs")):
+            values = self.option_values(args, option)
+            if values:
+                self.selectors[key] = values
+
+        if self.selectors and (self.shard or self.mergeshards):
+            self.fail("Partial builds can't be sharded.")
+
+        self.serve = "--serve" in args
+        port = self.option_value(args, "--port")
+        if port is not None:
+            if not port.isdigit():
+                self.fail("--port needs a port number.")
+            self.port = int(port)
+
+        if "--verbose" in args:
+            self.log.level = DEBUG
+        elif "--quiet" in args:
+            self.log.level = WARN
+
         if len(pages) == 0:
             self.log.warn("No pages configured/selected.")
 
+        if self.serve:
+            if len(pages) != 1:
+                self.fail("--serve needs exactly one page.")
+            page, = pages
+            Page(self.config, page, logger=self.log.sublogger(page.PAGEID), loglevel=self.log.level).serve(
+                "127.0.0.1", self.port)
+            return 0
+
         for page in pages:
             self.process_page(page)
 
@@ -98,15 +191,19 @@ class Updater:
 
     def process_page(self, pageconfig):
         self.log.out(f"Processing page '{pageconfig.PAGEID}'...")
-        p = Page(self.config, pageconfig, logger=None if self.fromcron else self.log.sublogger(pageconfig.PAGEID))
+        p = Page(self.config, pageconfig, logger=None if self.fromcron else self.log.sublogger(pageconfig.PAGEID),
+                 loglevel=self.log.level)
 
         if not self.noclone:
             p.clone_authors()
             if not self.noclonetemplates:
                 p.clone_templates()
-        if not self.nogenerate:
-            p.generate_content(self.generate_on_changes_only)
+        if self.mergeshards:
+            p.merge_shards(self.mergeshards)
+        elif not self.nogenerate:
+            p.generate_content(self.generate_on_changes_only, self.shard, self.outputdir, self.selectors)
         self.log.out(f"Done processing of '{pageconfig.PAGEID}'.")
+        self.log.flush()
 
 
 if __name__ == "__main__":